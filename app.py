@@ -1,23 +1,125 @@
+import io
 import os
-import re
+import csv
+import gzip
+import json
+import time
+import logging
+import threading
 import datetime
+import importlib
+import itertools
 import gspread
-import pandas as pd
-from flask import Flask, render_template,  request, jsonify
+from flask import Flask, Response, render_template,  request, jsonify, stream_with_context
 from google.oauth2.service_account import Credentials
-from utils import drop_top_rows, find_free_room, generate_timetable, get_timeslots, match_timeslot, \
-    order_files, preprocess, remove_xlsx_files
+from itsdangerous import BadSignature, URLSafeSerializer
+from werkzeug.exceptions import HTTPException
+from clash import clash_cache, conflict_free_sections, find_clashes
+from export import export_cache, export_cohort, export_timetable, weekdays
+from history import changes_cache, changes_since, record_version
+from logger import configure_logging
+from metrics import instrument, metrics, stage_timer
+from refresh import RefreshWorker
+from store import EmailList, FeedbackStore, RatingStore
+from sync import LocalSheetsClient, sync_timetable
+from utils import batch_timetables, build_timetable, compile_snapshot, day_files, find_free_room, free_rooms_by_timeslot, \
+    generate_timetable, get_timeslots, grid_cache, json_bytes, match_timeslot, next_free_slot, order_files, remove_extra_files, \
+    schedule_cache, schedule_json, time_str_to_minutes, timetable_cache, timetable_json, timetable_sources
 
 
 app = Flask(__name__)
 app.config.from_pyfile('config.py')
+configure_logging(app)
+instrument(app)
+
+log = logging.getLogger(__name__)
 
 timetable_path = app.config['TIMETABLE_PATH']
 spreadsheet_url = app.config['URL']
 credentials_path = app.config['CREDENTIALS_PATH']
 output_folder = timetable_path
 
-classes, labs = preprocess()
+feedback_store = FeedbackStore(app.config['DATABASE_PATH'])
+rating_store = RatingStore(app.config['DATABASE_PATH'])
+# feedback submitted before the store existed
+feedback_store.import_csv('feedback_data.csv')
+email_list = EmailList(os.path.join('Subscribed Emails', 'emails.txt'))
+
+# signs the free room selection handed to clients so any worker can resolve it
+selection_serializer = URLSafeSerializer(app.config['SECRET_KEY'], salt='free-room-selection')
+
+def day_file_path(day):
+    '''
+        path of the timetable file of a day e.g. Monday -> timetable/Monday.arrow
+        raises ValueError for something that isn't a day name and FileNotFoundError for a day without a file
+    '''
+    if not isinstance(day, str) or not day or os.path.basename(day) != day:
+        raise ValueError(f'Invalid day: {day}')
+    
+    files = dict(day_files())
+    if day not in files:
+        raise FileNotFoundError(f'No timetable for {day}')
+    
+    return files[day]
+
+def json_object():
+    '''
+        the JSON object sent as the request body
+        raises ValueError for a body that isn't one, answered with 400 like other invalid input
+    '''
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError('The request body must be a JSON object')
+    
+    return data
+
+@app.errorhandler(ValueError)
+def invalid_request(e):
+    # an invalid day, timeslot, time or body sent by the client
+    return jsonify({"error": str(e)}), 400
+
+@app.errorhandler(FileNotFoundError)
+def missing_day(e):
+    return jsonify({"error": str(e)}), 404
+
+@app.errorhandler(Exception)
+def server_error(e):
+    # not found routes, 405 and other http errors keep their own responses
+    if isinstance(e, HTTPException):
+        return e
+    
+    log.exception('Could not handle %s %s', request.method, request.path)
+    return jsonify({"error": str(e)}), 500
+
+def load_timetable():
+    '''
+        parse the timetable files into a new model and publish it with a single reference swap
+        routes read timetable_model once per request, so none of them sees a half updated timetable
+    '''
+    global timetable_model
+    
+    model = build_timetable(app.config['PARSE_WORKERS'], app.config['PARSE_POOL_MIN_BYTES'])
+    
+    # every version is kept with its cells so /changes can tell clients what changed since theirs
+    try:
+        snapshot, _ = record_version(model, limit=app.config['HISTORY_LIMIT'])
+        app.config['TIME'] = snapshot.created
+    except OSError:
+        log.exception('Could not store timetable version %s', model.version)
+        app.config['TIME'] = datetime.datetime.now()
+    
+    timetable_model = model
+
+load_timetable()
+
+@app.cli.command("compile-snapshot")
+def compile_snapshot_command():
+    '''
+        build step: flask --app app compile-snapshot
+        compiles the timetable files so workers start without parsing xlsx
+    '''
+    for file in compile_snapshot():
+        print(f'Compiled {file}')
 
 @app.route("/get_modification_time", methods=["GET"])
 def modification_time():
@@ -26,7 +128,7 @@ def modification_time():
     '''
     modification_date = app.config['TIME']
 
-    print(f"Last modification date: {modification_date}")
+    log.debug("Last modification date: %s", modification_date)
     
     return jsonify(modification_date)
 
@@ -34,264 +136,565 @@ def modification_time():
 def all_subjects():
     '''
         this route returns list of all subjects avaialable in the timetable
+        the list is built once per timetable load, clients can revalidate with If-None-Match
     '''
-    subjects = []
-    # Regular expression pattern to match time values like "1:30-2:50"
-    time_pattern = r'\d+:\d+-\d+:\d+'
-
-    # Get a list of all files in the folder
-    all_files = os.listdir(timetable_path)
-
-    # Filter for files with .xlsx extension
-    xlsx_files = [file for file in all_files if file.endswith(".xlsx")]
-    # xlsx_files.remove('Welcome.xlsx')
-
-    # # Loop through each Excel file and read its contents
-    for excel_file in xlsx_files:
-        # Construct the full path to the Excel file within the subfolder
-        excel_file_path = os.path.join(timetable_path, excel_file)
-
-        temp = pd.read_excel(excel_file_path)
-        # Remove top rows
-        temp = drop_top_rows(temp)
+    model = timetable_model
+    
+    response = jsonify(model.subjects)
+    response.set_etag(model.subjects_etag)
+    response.cache_control.no_cache = True
+    
+    # answers 304 Not Modified when the client already has this version
+    return response.make_conditional(request)
 
-        # Remove the first column
-        temp = temp.iloc[:, 1:]
+@app.route("/subjects/search", methods=["GET"])
+def search_subjects():
+    '''
+        subjects matching ?q= for autocomplete, best matches first
+        ?limit= caps the results, 10 by default
+    '''
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 10, type=int)
+    
+    # keep responses small
+    limit = max(1, min(limit, 50))
+    
+    return jsonify(timetable_model.subject_search.search(query, limit)), 200
 
-        # Remove time values in the format "1:30-2:50" using regular expressions
-        temp = temp.applymap(lambda cell: re.sub(time_pattern, '', str(cell)))
+@app.route("/rooms", methods=["GET"])
+def rooms():
+    '''
+        every room and lab in the timetable
+    '''
+    return jsonify(sorted(timetable_model.room_schedules)), 200
 
-        # Flatten and extend subjects
-        subjects.extend(temp.values.flatten())
+@app.route("/instructors", methods=["GET"])
+def instructors():
+    '''
+        every instructor named in the timetable
+    '''
+    return jsonify(sorted(timetable_model.instructor_schedules)), 200
 
-    # Remove empty strings and strip whitespace
-    subjects = [subject.strip() for subject in subjects if subject.strip()]
+@app.route("/room-schedule", methods=["GET"])
+def room_schedule():
+    '''
+        the week of a room or lab, ?room=C-301
+    '''
+    return schedule_response(timetable_model, 'room_schedules', request.args.get('room'))
 
-    # Remove duplicates and sort
-    subjects = list(set(subjects))
+@app.route("/instructor-schedule", methods=["GET"])
+def instructor_schedule():
+    '''
+        the week of an instructor, ?instructor=...
+    '''
+    return schedule_response(timetable_model, 'instructor_schedules', request.args.get('instructor'))
 
-    # remove nan values
-    subjects = [subject for subject in subjects if str(subject) != 'nan']
-    subjects.sort() # I wonder why sort function doesn't work on this list
-    return jsonify(subjects)
+def schedule_response(model, view, name):
+    body = schedule_json(getattr(model, view), name, view, model.version)
+    if body is None:
+        return jsonify({"error": f"No schedule for {name}"}), 404
+    
+    # the schedule only changes with the timetable, pollers get 304 until then
+    response = Response(body, mimetype='application/json')
+    response.set_etag(model.version)
+    response.cache_control.no_cache = True
+    return compressed(response.make_conditional(request))
+
+@app.route("/changes", methods=["GET"])
+def timetable_changes():
+    '''
+        cell level changes since the timetable version a client has, /changes?since=<version>
+        without since only the current version is returned, a starting point for polling
+        410 when since is unknown or too old to be in the history, the client has to reload everything
+    '''
+    model = timetable_model
+    since = request.args.get('since')
+    
+    if not since:
+        return jsonify({"version": model.version, "changes": []}), 200
+    
+    # a client can know a newer version than this process, it catches up before answering
+    if since != model.version and reload_if_stale():
+        model = timetable_model
+    
+    try:
+        changes = changes_since(since, model.cells, model.version)
+    except KeyError:
+        return jsonify({"error": f"Unknown version {since}, reload the timetable.", "version": model.version}), 410
+    
+    # nothing new until the next version, pollers get 304 until then
+    response = jsonify({"since": since, "version": model.version, "changes": changes})
+    response.set_etag(model.version)
+    response.cache_control.no_cache = True
+    return compressed(response.make_conditional(request))
 
 # Define the /time-table route to return the timetable
 @app.route("/time-table", methods=["POST"])
 def get_time_table():
     data = request.get_json()
-    subjects = data.get("subjects", [])
+    subjects = data.get("subjects", []) if isinstance(data, dict) else None
+    
+    if not isinstance(subjects, list) or not all(isinstance(subject, str) for subject in subjects):
+        return jsonify({"error": "Provide a list of subjects."}), 400
+    
+    log.info('Timetable requested for %d subjects', len(subjects))
+    log.debug('Selected subjects: %s', subjects)
     
-    print('--------------------------')
-    print('Selected Subjects')
-    print('--------------------------')
-    print(subjects)
-    print('type of subjects variable : ', type(subjects))
-    print('--------------------------')
+    model = timetable_model
     
-    df = generate_timetable(subjects, classes, labs)
+    # records are encoded straight to JSON, the DataFrame is only built when DEBUG is on
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug('Generated timetable:\n%s', generate_timetable(subjects, model.subject_index))
 
-    print('--------------------------')
-    print('Generated Timetable')
-    print('--------------------------')
-    print(df)
-    print('--------------------------')
+    with stage_timer('json_serialization'):
+        body = timetable_json(subjects, model.subject_index, version=model.version)
 
-    # Convert the timetable DataFrame to JSON format
-    timetable_json = df.to_json(orient="records")
+    return compressed(Response(body, mimetype='application/json'))
 
-    print(timetable_json)
+def compressed(response):
+    '''
+        gzips the response body when the client accepts it and it is at least COMPRESS_MIN_SIZE bytes
+    '''
+    response.vary.add('Accept-Encoding')
+    
+    if app.config['COMPRESS_MIN_SIZE'] is None or (response.content_length or 0) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+    if 'gzip' not in request.accept_encodings:
+        return response
+    
+    with stage_timer('compression'):
+        response.set_data(gzip.compress(response.get_data(), compresslevel=app.config['COMPRESS_LEVEL']))
+    response.content_encoding = 'gzip'
+    return response
 
-    # Return the JSON response
-    return timetable_json
 
+@app.route("/time-table/batch", methods=["POST"])
+def get_time_tables():
+    '''
+        timetables of many students in one request
+        body: {"students": [{"id": ..., "subjects": [...]}, ...]}
+        streams one JSON line per student as soon as it is ready: {"id": ..., "timetable": [...]}
+        or {"id": ..., "error": ...} for an entry that can't be used
+    '''
+    data = request.get_json()
+    students = data.get("students") if isinstance(data, dict) else None
+    
+    if not isinstance(students, list):
+        return jsonify({"error": "Provide a list of students."}), 400
+    if len(students) > app.config['BATCH_MAX_STUDENTS']:
+        return jsonify({"error": f"At most {app.config['BATCH_MAX_STUDENTS']} students per batch."}), 413
+    
+    log.info('Batch timetable requested for %d students', len(students))
+    
+    # the whole batch is answered from the model it started with
+    subject_index = timetable_model.subject_index
+    
+    def generate():
+        for student_id, records, error in batch_timetables(students, subject_index):
+            if error is not None:
+                yield json_bytes({"id": student_id, "error": error}) + b'\n'
+            else:
+                yield json_bytes({"id": student_id, "timetable": records}) + b'\n'
+                
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route("/clashes", methods=["POST"])
+def get_clashes():
+    '''
+        overlapping classes between the chosen subjects
+        body: {"subjects": [...]}
+    '''
+    data = request.get_json()
+    subjects = data.get("subjects") if isinstance(data, dict) else None
+    
+    if not isinstance(subjects, list) or not all(isinstance(subject, str) for subject in subjects):
+        return jsonify({"error": "Provide a list of subjects."}), 400
+    
+    model = timetable_model
+    clashes = find_clashes(subjects, model.subject_index, version=model.version)
+    return jsonify({"clashes": clashes}), 200
 
-@app.route("/update-timetable", methods=["GET"])
-def download_sheet_as_excel():
+@app.route("/section-plans", methods=["POST"])
+def get_section_plans():
+    '''
+        combinations of sections without clashes, one section per course
+        body: {"courses": [["OOP (CS-A)", "OOP (CS-B)"], ["DLD (CS-A)", ...]], "limit": 10}
+    '''
+    data = request.get_json()
+    courses = data.get("courses") if isinstance(data, dict) else None
+    
+    if not isinstance(courses, list) or not all(
+            isinstance(sections, list) and all(isinstance(section, str) for section in sections) for sections in courses):
+        return jsonify({"error": "Provide a list of courses, each a list of sections."}), 400
+    
+    # the search can grow with the product of the section counts, the limit alone doesn't bound it
+    max_courses, max_sections = app.config['SECTION_PLAN_MAX_COURSES'], app.config['SECTION_PLAN_MAX_SECTIONS']
+    if len(courses) > max_courses or any(len(sections) > max_sections for sections in courses):
+        return jsonify({"error": f"At most {max_courses} courses of {max_sections} sections each."}), 413
+    
+    try:
+        limit = int(data.get("limit", 10))
+    except (TypeError, ValueError):
+        return jsonify({"error": "limit must be a number."}), 400
+    # keep the search bounded
+    limit = max(1, min(limit, 100))
+    
+    model = timetable_model
+    plans, unknown = conflict_free_sections(courses, model.subject_index, limit=limit, version=model.version)
+    return jsonify({"plans": plans, "unknown": unknown}), 200
+
+
+@app.route("/time-table/export", methods=["POST"])
+def export_time_table():
+    '''
+        the timetable of some subjects as a calendar file or csv
+        body: {"subjects": [...], "format": "ics" | "csv", "start": "2024-01-22", "weeks": 16}
+        ics has one weekly event per class from start (TERM_START, else this week's monday) for weeks weeks,
+        a dated or 'Only' session is a single event and a cancelled class skips this week
+        a whole cohort is exported as one csv with {"students": [{"id": ..., "subjects": [...]}, ...], "format": "csv"}
+    '''
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "Provide subjects or students."}), 400
+    
+    fmt = data.get("format", "ics")
+    if fmt not in ("ics", "csv"):
+        return jsonify({"error": "format must be ics or csv."}), 400
+    
+    model = timetable_model
+    
+    if "students" in data:
+        students = data["students"]
+        if fmt != "csv" or not isinstance(students, list):
+            return jsonify({"error": "Cohorts are exported as csv from a list of students."}), 400
+        if len(students) > app.config['BATCH_MAX_STUDENTS']:
+            return jsonify({"error": f"At most {app.config['BATCH_MAX_STUDENTS']} students per batch."}), 413
+        
+        body = export_cohort(students, model.subject_index, model.subjects, model.version)
+    else:
+        subjects = data.get("subjects")
+        if not isinstance(subjects, list) or not all(isinstance(subject, str) for subject in subjects):
+            return jsonify({"error": "Provide a list of subjects."}), 400
+        
+        try:
+            weeks = int(data.get("weeks", app.config['TERM_WEEKS']))
+            body = export_timetable(subjects, model.subject_index, model.subjects, model.version, fmt,
+                                    data.get("start") or app.config['TERM_START'], weeks, app.config['TIMEZONE'])
+            # the first chunk checks the start date before the response is committed to
+            first = next(body)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid start or weeks: {e}"}), 400
+        
+        body = itertools.chain([first], body)
+    
+    mimetype = 'text/calendar' if fmt == 'ics' else 'text/csv'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=timetable.{fmt}'
+    return response
+
+
+def sheets_client():
+    '''
+        gspread client for the timetable spreadsheet, or the local stand-in when SHEETS_CLIENT is 'local'
+        any other client can be plugged in as 'module:factory', the factory is called with the app config
+    '''
+    if app.config['SHEETS_CLIENT'] == 'local':
+        return LocalSheetsClient(app.config['LOCAL_SHEETS_PATH'])
+    
+    if ':' in app.config['SHEETS_CLIENT']:
+        module, _, factory = app.config['SHEETS_CLIENT'].partition(':')
+        return getattr(importlib.import_module(module), factory)(app.config)
+    
     # Load credentials from the JSON file with the specified scopes
     scopes = ['https://www.googleapis.com/auth/spreadsheets.readonly', 'https://www.googleapis.com/auth/drive']
     credentials = Credentials.from_service_account_file(credentials_path, scopes=scopes)
 
     # Authenticate with the Google Sheets API using the updated credentials
-    gc = gspread.authorize(credentials)
+    return gspread.authorize(credentials)
 
+def refresh_timetable():
+    '''
+        syncs the timetable files from the spreadsheet and publishes a new model when the files changed
+        runs on the refresh worker thread, never inside a request
+    '''
+    # only the worksheets that changed since the last sync are downloaded
     try:
-        # Open the Google Spreadsheet using its URL
-        spreadsheet = gc.open_by_url(spreadsheet_url)
-        print(spreadsheet.title)
-
-        # Iterate through each sheet in the spreadsheet
-        for worksheet in spreadsheet.worksheets():
-            # Get all values from the worksheet
-            values = worksheet.get_all_values()
+        with stage_timer('sheets_download'):
+            changed = sync_timetable(sheets_client(), spreadsheet_url, output_folder, workers=app.config['SHEETS_FETCH_WORKERS'])
+    except Exception:
+        metrics.inc('timetable_refreshes_total', result='failed')
+        raise
+    
+    # remove extra unnecessary files
+    remove_extra_files()
+    
+    # compared with what this process loaded, another worker may have done the download
+    reloaded = reload_if_stale()
+        
+    metrics.inc('timetable_refreshes_total', result='reloaded' if reloaded else 'unchanged')
+        
+    return {"updated": changed, "reloaded": reloaded}
 
-            # Convert the values to a Pandas DataFrame
-            df = pd.DataFrame(values[1:], columns=values[0])
+# one reload at a time, whether the refresh job, the source check or /changes asks for it
+reload_lock = threading.Lock()
 
-            # Check if the folder already exists
-            if not os.path.exists(output_folder):
-                # Create the folder if it doesn't exist
-                os.makedirs(output_folder)
+def reload_if_stale():
+    '''
+        reloads the timetable when its files changed since this process loaded them, returns whether it did
+        a refresh downloads the files once for all worker processes, every process reloads itself
+    '''
+    with reload_lock:
+        loaded = dict(timetable_model.sources)
+        current = dict(timetable_sources())
+        stale = [file for file in current if loaded.get(file) != current[file]]
+        
+        if not stale and len(loaded) == len(current):
+            return False
+        
+        # unchanged days are served from their snapshot and cached grids
+        for file in stale:
+            grid_cache.invalidate(os.path.join(output_folder, file))
+        load_timetable()
+        return True
 
-            # Specify the path to save the Excel file
-            excel_file_path = f'{output_folder}/{worksheet.title}.xlsx'
+refresh_worker = RefreshWorker(refresh_timetable)
+reload_worker = RefreshWorker(reload_if_stale)
 
-            # Save the DataFrame to an Excel file
-            df.to_excel(excel_file_path, index=False)
+if app.config['REFRESH_INTERVAL']:
+    refresh_worker.schedule(app.config['REFRESH_INTERVAL'])
 
-            print(f'Sheet "{worksheet.title}" downloaded and saved as {excel_file_path}')
+# monotonic time of the last source check of this process
+sources_checked = 0.0
 
-            # Update modification time
-            app.config['TIME'] = datetime.datetime.now()
-            
-            # remove extra unnecessary files
-            remove_xlsx_files()
-            classes, labs = preprocess()
+@app.before_request
+def check_timetable_sources():
+    '''
+        at most every SOURCE_CHECK_INTERVAL seconds a request compares the timetable files with the loaded ones
+        so workers that didn't run a refresh pick up its files too, the reload runs in the background
+        and requests are served from the loaded timetable until it is swapped
+    '''
+    global sources_checked
+    
+    interval = app.config['SOURCE_CHECK_INTERVAL']
+    now = time.monotonic()
+    if not interval or now - sources_checked < interval:
+        return
+    sources_checked = now
+    
+    try:
+        stale = timetable_sources() != timetable_model.sources
+    except OSError:
+        # a file replaced while it was listed, the next check sees the result
+        return
+    
+    if stale:
+        reload_worker.submit()
 
-        # Return a success response
-        return jsonify({"message": "Timetable update successful", "code": 200}), 200
+@app.route("/update-timetable", methods=["GET"])
+def download_sheet_as_excel():
+    '''
+        queues a timetable refresh and returns right away with the job id
+        progress is available from /update-timetable/<job_id>
+    '''
+    job_id = refresh_worker.submit()
+    status_url = f'/update-timetable/{job_id}'
+    
+    response = jsonify({"message": "Timetable update started", "job_id": job_id, "status_url": status_url, "code": 202})
+    response.headers['Location'] = status_url
+    
+    return response, 202
 
-    except gspread.exceptions.APIError as e:
-        # Return an error response
-        error_message = f"Error accessing Google Sheets API: {e}"
-        print(error_message)
-        return jsonify({"error": error_message, "code": 500}), 500
+@app.route("/update-timetable/<job_id>", methods=["GET"])
+def update_status(job_id):
+    '''
+        status of a refresh job: queued, running, done or failed
+        jobs live in the process that queued them
+    '''
+    job = refresh_worker.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id", "code": 404}), 404
+    
+    return jsonify(job), 200
 
 @app.route("/submit-rating", methods=["POST"])
 def submit_rating():
     """
     Route to receive and store a rating submitted by a client.
     """
-    data = request.get_json()
+    data = json_object()
     rating = data.get("rating")
 
     # Check if the rating is valid (an integer between 1 and 5)
-    if not isinstance(rating, int) or rating < 1 or rating > 5:
+    if not isinstance(rating, int) or isinstance(rating, bool) or rating < 1 or rating > 5:
         return jsonify({"error": "Invalid rating. Please provide an integer between 1 and 5."}), 400
 
-    # Here you can store the rating however you want, e.g., in a database
-    # For demonstration purposes, let's just print the rating
-    print("Received rating:", rating)
-    
-    # retrieve variables from file
-    total_ratings = app.config['TOTAL_RATINGS']
-    sum_rating = app.config['SUM_RATING']
-    average = app.config['AVERAGE']
+    log.info("Received rating: %s", rating)
     
-    # calculate
-    total_ratings += 1
-    sum_rating += rating
-    average = sum_rating / total_ratings
-    
-    print(f'Calculations : total_ratings{total_ratings}, sum_rating{sum_rating}, average{average}')
-    
-    # write to file
-    app.config['TOTAL_RATINGS'] = total_ratings
-    app.config['SUM_RATING'] = sum_rating
-    app.config['AVERAGE'] = average
+    # one atomic increment in the shared store, every worker sees it
+    rating_store.add(rating)
 
     return jsonify({"message": "Rating submitted successfully.", "rating": rating}), 200
 
 # Route to fetch the current rating
 @app.route("/current-rating", methods=["GET"])
 def get_current_rating():
-    average = app.config['AVERAGE']
-    total_ratings = app.config['TOTAL_RATINGS']
+    aggregate = rating_store.aggregate()
     
-    print(average, total_ratings)
-    return jsonify({"rating": average, "total votes": total_ratings})
+    return jsonify({"rating": aggregate['average'], "total votes": aggregate['total'],
+                    "histogram": aggregate['histogram']})
+
+# Prometheus scrape endpoint
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Route to monitor the parsed day grid cache
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    return jsonify({**grid_cache.stats(), "clash_cache": clash_cache.stats(), "timetable_cache": timetable_cache.stats(),
+                    "schedule_cache": schedule_cache.stats(), "export_cache": export_cache.stats(), "changes_cache": changes_cache.stats()}), 200
 
 # Route to fetch available files
 @app.route("/get_files", methods=["GET"])
 def get_files():
-    path = 'timetable'
-    files = os.listdir(path)
-    files = sorted(files, key=order_files)
-    files = [file.split('.')[0] for file in files]
+    files = [day for day, _ in day_files()]
     
     return jsonify(files), 200
 
 @app.route("/selected-file", methods=["POST"])
 def selected_file():
     """
-    Route to receive and store a file selected by the client
+    Route to receive a file selected by the client and return its timeslots
+    nothing is stored on the server, the selection comes back as a signed
+    X-Selection-Token header that /get-free-room accepts
     """
-    data = request.get_json()
-    file = data.get("file") + ".xlsx"
-    file_path = os.path.join('timetable', file)
+    data = json_object()
+    day = data.get("file")
     stype = data.get("selection_type")
     
-    print(f'Client Selected File: {file} and asked to search in {stype}')
+    log.info('Client selected file %s and asked to search in %s', day, stype)
     
-    try:
-        timeslots, classes_df, lab_df = get_timeslots(file_path, stype)
-        
-        # Dump this data in the config.py file for later use
-        app.config['CLASS_DF'] = classes_df
-        app.config['LAB_DF'] = lab_df
-        app.config['SELECTION_TYPE'] = stype
-        
-        return jsonify(timeslots), 200
+    timeslots, _ = get_timeslots(day_file_path(day), stype)
     
-    except Exception as e:
-        print(e)
-        return jsonify({"error": str(e)}), 500  # Handle errors gracefully
+    response = jsonify(timeslots)
+    response.headers['X-Selection-Token'] = selection_serializer.dumps({'file': day, 'selection_type': stype})
+    
+    return response, 200
 
 
 @app.route("/get-free-room", methods=["POST"])
 def get_free_room():
     """
         Route to receive selected timeslot and return free rooms
+        the request carries the day and selection type, either as file and selection_type
+        or as the token returned by /selected-file (in the body or the X-Selection-Token header)
+    """
+    data = json_object()
+    selected_timeslot = data.get("timeslot")
+    log.info('Free rooms requested for timeslot %s', selected_timeslot)
+    
+    token = data.get("token") or request.headers.get('X-Selection-Token')
+    if token:
+        try:
+            selection = selection_serializer.loads(token)
+        except BadSignature:
+            return jsonify({"error": "Invalid selection token."}), 400
+    else:
+        selection = data
+        
+    day = selection.get("file")
+    stype = selection.get("selection_type")
+    if not day or not stype:
+        return jsonify({"error": "Provide file and selection_type, or the token from /selected-file."}), 400
+
+    _, grid = get_timeslots(day_file_path(day), stype)
+    result = find_free_room(selected_timeslot, stype, grid)
+    log.debug('Free rooms: %s', result)
+    return jsonify(result), 200
+    
+    
+@app.route("/day-free-rooms", methods=["POST"])
+def day_free_rooms():
+    """
+        Route to return free rooms / labs for every timeslot of a day in one call
+        an optional span asks for rooms free for that many consecutive timeslots
     """
-    print('user called get free room route')
+    data = json_object()
+    stype = data.get("selection_type", "Room")
     try:
-        data = request.get_json()
-        selected_timeslot = data.get("timeslot")
-        print('user selected timeslot : ', selected_timeslot)
-        stype = app.config['SELECTION_TYPE']
-    
-        classes_df = app.config['CLASS_DF']
-        lab_df = app.config['LAB_DF']
-        result = find_free_room(selected_timeslot, stype, classes_df, lab_df)
-        print('result : ', result)
-        return jsonify(result), 200
-    except Exception as e:
-        print(e)
-        return jsonify({"error": str(e)}), 500
+        span = int(data.get("span", 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "span must be a positive integer"}), 400
+    
+    if span < 1:
+        return jsonify({"error": "span must be a positive integer"}), 400
     
+    _, grid = get_timeslots(day_file_path(data.get("file")), stype)
+    return jsonify(free_rooms_by_timeslot(stype, grid, span)), 200
     
 @app.route('/now-empty', methods=["GET", "POST"])
 def now_empty():
+    data = json_object()
+    current_day = data.get('current-day')
+    current_time = data.get('current-time')
+    if not isinstance(current_time, str):
+        return jsonify({'error': 'Provide current-time like 10:30AM'}), 400
+    
+    # select file of current day
+    file_path = day_file_path(current_day)
+    
+    grid = grid_cache.get(file_path)
+    
+    selected_timeslot1 = match_timeslot(current_time, grid.room_occupancy)
+    selected_timeslot2 = match_timeslot(current_time, grid.lab_occupancy)
+    
+    if selected_timeslot1 is None and selected_timeslot2 is None:
+        return jsonify({'message': "University Closed. Try Again later in office timings."}), 201
+    
+    # one of the two can be closed while the other is still running
+    result1 = find_free_room(selected_timeslot1, 'Room', grid) if selected_timeslot1 is not None else []
+    result2 = find_free_room(selected_timeslot2, 'Lab', grid) if selected_timeslot2 is not None else []
+    
+    return jsonify({'result1': result1, 'result2': result2}), 200
+    
+@app.route('/next-free-slot', methods=["POST"])
+def next_free_room_slot():
+    """
+        Route to find the next timeslot in which a room / lab is free, looking ahead across the week
+    """
+    data = json_object()
+    room = data.get('room')
+    stype = data.get('selection_type', 'Room')
+    current_day = data.get('current-day')
+    current_time = data.get('current-time')
+    # any day of the week, a day without a timetable like Saturday looks ahead to Monday
+    if current_day not in weekdays:
+        return jsonify({'error': f'Invalid day: {current_day}'}), 400
+    if not isinstance(current_time, str):
+        return jsonify({'error': 'Provide current-time like 10:30AM'}), 400
+    
+    # the week starting today, wrapping around to the days before it
+    files = day_files()
+    today = order_files(current_day)
+    files = [(day, file) for day, file in files if order_files(day) >= today] + \
+        [(day, file) for day, file in files if order_files(day) < today]
+    
+    days = [day for day, _ in files]
+    grids = [(day, grid_cache.get(file)) for day, file in files]
+    
+    # the current time only matters if today is in the timetable
+    minute = time_str_to_minutes(current_time) if days and days[0] == current_day else 0
+    
     try:
-        data = request.get_json()
-        # print(data)
-        
-        current_day = data.get('current-day')
-        current_time = data.get('current-time')
-        # print(current_time)
-        
-        # select file of current day
-        file = current_day + ".xlsx"
-        file_path = os.path.join('timetable', file)
-        
-        timeslots1, classes_df, _ = get_timeslots(file_path, stype='Room')
-        timeslots2, _, lab_df = get_timeslots(file_path, stype='Lab')
-        # print(timeslots1, timeslots2)
-        
-        selected_timeslot1 = match_timeslot(current_time, timeslots1, stype='Room')
-        selected_timeslot2 = match_timeslot(current_time, timeslots2, stype='Lab')
-        # print(selected_timeslot1, selected_timeslot2)
-        
-        if selected_timeslot1 is None and selected_timeslot2 is None:
-            return jsonify({'message': "University Closed. Try Again later in office timings."}), 201
-        
-        result1 = find_free_room(selected_timeslot1, 'Room', classes_df, lab_df)
-        result2 = find_free_room(selected_timeslot2, 'Lab', classes_df, lab_df)        
-        
-        return jsonify({'result1': result1, 'result2': result2}), 200
+        result = next_free_slot(room, stype, grids, minute)
+    except KeyError:
+        return jsonify({'error': f'No {str(stype).lower()} named {room} in the timetable'}), 404
+    if result is None:
+        return jsonify({'message': f'{room} is not free in any timeslot this week'}), 404
     
-    except Exception as e:
-        print(e)
-        return jsonify({'error': str(e)}), 500
+    day, timeslot = result
+    return jsonify({'day': day, 'timeslot': timeslot}), 200
     
 @app.route('/subscribe-email', methods=['POST'])
 def subscribe_email():
@@ -300,15 +703,9 @@ def subscribe_email():
     """
     try:
         data = request.get_json()
-        path = 'Subscribed Emails'
-        
-        if not os.path.exists(path):
-            os.mkdir(path)
-            
-        # Open the file in append mode to write new emails into it
-        with open(f"{path}/emails.txt", "a") as file:
-            # Write new emails into the file
-            file.write(f"{data.get('email')}\n")        
+
+        # appended to Subscribed Emails/emails.txt in the next batch
+        email_list.add(data.get('email'))
         
         return jsonify({"success": "email subscribed successfully"}) ,200
     except Exception as e:
@@ -318,27 +715,54 @@ def subscribe_email():
 def get_feedback():
     try:
         data = request.get_json()
+        
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Feedback must be a JSON object'}), 400
 
-        # Convert data into a DataFrame
-        feedback_df = pd.DataFrame([data])
-
-        # Check if the CSV file exists
-        csv_file = 'feedback_data.csv'
-        if os.path.exists(csv_file):
-            # Append the DataFrame to the existing CSV file
-            existing_df = pd.read_csv(csv_file)
-            updated_df = pd.concat([existing_df, feedback_df], ignore_index=True)
-        else:
-            updated_df = feedback_df
-
-        # Write the updated DataFrame to CSV
-        updated_df.to_csv(csv_file, index=False)
+        # appended to the store in the next batch, nothing already stored is read back
+        feedback_store.add(data)
 
         return jsonify({'message': 'Feedback submitted successfully'}), 200
 
     except Exception as e:
         return jsonify({'message': f'There was an error in storing the feedack {e}'}), 500
     
+@app.route('/feedback-export', methods=['GET'])
+def export_feedback():
+    '''
+        streams all stored feedback as JSON lines, or as CSV with ?format=csv
+    '''
+    if request.args.get('format') == 'csv':
+        # the columns are all keys used by any feedback
+        columns = ['created']
+        count = 0
+        for count, feedback in enumerate(feedback_store.export(), 1):
+            columns.extend(key for key in feedback if key not in columns)
+        
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=columns)
+            writer.writeheader()
+            
+            # the store only grows, the first count rows are the ones the columns came from
+            # feedback arriving in the meantime waits for the next export
+            for feedback in itertools.islice(feedback_store.export(), count):
+                writer.writerow(feedback)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                
+            yield buffer.getvalue()
+            
+        return Response(stream_with_context(generate()), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=feedback.csv'})
+    
+    def generate():
+        for feedback in feedback_store.export():
+            yield json.dumps(feedback) + '\n'
+            
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
     
 @app.route('/')
 def index():
@@ -0,0 +1,14 @@
+'''
+    ASGI entry point, serves the same routes from an ASGI server
+    
+        pip install asgiref uvicorn
+        uvicorn asgi:application --workers 4
+    
+    requests run on the adapter's thread pool while the event loop keeps handling connections, slow clients
+    don't hold a worker thread. refreshes run on the refresh worker and feedback / email writes on their
+    writer threads, so no request waits on Sheets or storage and reads only touch the in-memory model
+'''
+from asgiref.wsgi import WsgiToAsgi
+from app import app
+
+application = WsgiToAsgi(app)
@@ -0,0 +1,103 @@
+'''
+    writes synthetic timetable files in the same layout as the real ones
+
+        row 1       day name and title, read as the header by read_excel
+        rows 2-4    program names, skipped by split_sheet
+        row 5       'Room' followed by the class timeslots, three columns per timeslot
+        ...         one row per room
+        next row    'Lab' followed by the lab timeslots, one column per timeslot
+        ...         one row per lab
+
+    python benchmarks/generate.py out_folder --rooms 300 --slots 24 --subjects 4000
+'''
+import os
+import random
+import argparse
+from openpyxl import Workbook
+
+days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+
+def clock(minutes):
+    # the timetable writes times without AM/PM
+    hour, minute = divmod(minutes, 60)
+    hour = hour % 12 or 12
+    return f'{hour:02d}:{minute:02d}'
+
+def make_timeslots(count, length):
+    '''
+        count back to back timeslots from 08:30 fitted into a 12 hour day
+    '''
+    step = min(length + 10, (12 * 60) // count)
+    start = 8 * 60 + 30
+    return [f'{clock(start + i * step)}-{clock(start + i * step + step - 10)}' for i in range(count)]
+
+def make_subjects(count, rng):
+    sections = ['A', 'B', 'C', 'D', 'E', 'F']
+    programs = ['CS', 'DS', 'AI', 'CY', 'SE']
+    return [f'Course {i} ({rng.choice(programs)}-{rng.choice(sections)})' for i in range(count)]
+
+def cell(subjects, rng, fill, cancelled):
+    if rng.random() >= fill:
+        return None
+    subject = rng.choice(subjects)
+    if rng.random() < cancelled:
+        subject += ' Cancelled'
+    return subject
+
+def write_day(path, day, subjects, rng, rooms, labs, slots, lab_slots, fill, cancelled):
+    class_timeslots = make_timeslots(slots, 80)
+    lab_timeslots = make_timeslots(lab_slots, 165)
+    width = 1 + 3 * slots
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = day
+
+    sheet.append([day, 'Synthetic TimeTable'] + [None] * (width - 2))
+    for batch in range(3):
+        sheet.append([None, None] + [f'Program {batch}-{i}' for i in range(width - 2)])
+
+    header = ['Room']
+    for timeslot in class_timeslots:
+        header += [timeslot, None, None]
+    sheet.append(header)
+
+    for room in range(rooms):
+        row = [f'R-{room + 1:03d}']
+        for _ in class_timeslots:
+            row += [cell(subjects, rng, fill, cancelled), None, None]
+        sheet.append(row)
+
+    sheet.append(['Lab'] + lab_timeslots + [None] * (width - 1 - lab_slots))
+    for lab in range(labs):
+        row = [f'Lab-{lab + 1:03d}'] + [cell(subjects, rng, fill, cancelled) for _ in lab_timeslots]
+        sheet.append(row + [None] * (width - len(row)))
+
+    workbook.save(path)
+
+def generate(folder, rooms=100, labs=20, slots=8, lab_slots=4, subjects=1000, fill=0.6, cancelled=0.02, seed=0):
+    '''
+        writes Monday.xlsx ... Friday.xlsx into folder and returns the subject names used
+    '''
+    rng = random.Random(seed)
+    names = make_subjects(subjects, rng)
+
+    os.makedirs(folder, exist_ok=True)
+    for day in days:
+        write_day(os.path.join(folder, f'{day}.xlsx'), day, names, rng, rooms, labs, slots, lab_slots, fill, cancelled)
+
+    return names
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic timetable files.')
+    parser.add_argument('folder')
+    parser.add_argument('--rooms', type=int, default=100)
+    parser.add_argument('--labs', type=int, default=20)
+    parser.add_argument('--slots', type=int, default=8)
+    parser.add_argument('--lab-slots', type=int, default=4)
+    parser.add_argument('--subjects', type=int, default=1000)
+    parser.add_argument('--fill', type=float, default=0.6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.folder, args.rooms, args.labs, args.slots, args.lab_slots, args.subjects, args.fill, seed=args.seed)
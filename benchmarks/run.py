@@ -0,0 +1,185 @@
+'''
+    benchmarks the timetable pipeline and the HTTP routes on a synthetic timetable
+
+    python benchmarks/run.py --scale campus
+    python benchmarks/run.py --scale campus --compare benchmarks/results/<commit>-campus.json
+
+    every run works in a temporary folder with its own timetable/, database and snapshot,
+    results are written to benchmarks/results/<commit>-<scale>.json so runs of different commits can be compared
+'''
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate import generate
+
+scales = {
+    'small': dict(rooms=40, labs=10, slots=8, lab_slots=4, subjects=300),
+    'campus': dict(rooms=200, labs=40, slots=16, lab_slots=6, subjects=2000),
+    'large': dict(rooms=600, labs=80, slots=36, lab_slots=12, subjects=5000),
+}
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def measure(fn, repeat):
+    '''
+        runs fn repeat times and reports p50 / p99 latency in milliseconds and calls per second
+    '''
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    return {
+        'runs': repeat,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'throughput': repeat / sum(samples),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+def run(scale, repeat, seed):
+    rng = random.Random(seed)
+    workdir = tempfile.mkdtemp(prefix='timetable-bench-')
+    results = {}
+
+    try:
+        subjects = generate(os.path.join(workdir, 'timetable'), seed=seed, **scales[scale])
+
+        # utils and app resolve their folders from the working directory on import
+        os.chdir(workdir)
+        import utils
+
+        results['preprocess_xlsx'] = measure(
+            lambda: (shutil.rmtree(utils.snapshot_folder, ignore_errors=True), utils.preprocess()),
+            max(1, repeat // 50),
+        )
+        results['preprocess_snapshot'] = measure(utils.preprocess, max(1, repeat // 20))
+
+        subject_index = utils.preprocess()[3]
+        results['generate_timetable'] = measure(
+            lambda: utils.generate_timetable(rng.sample(subjects, rng.randint(6, 8)), subject_index),
+            repeat,
+        )
+
+        day_file = os.path.join('timetable', 'Monday.xlsx')
+        grid = utils.grid_cache.get(day_file)
+        results['find_free_room'] = measure(
+            lambda: utils.find_free_room(rng.choice(grid.room_timeslots), 'Room', grid),
+            repeat,
+        )
+
+        times = [f'{hour}:{minute:02d}{half}' for hour in range(1, 13) for minute in (0, 15, 30, 45) for half in ('AM', 'PM')]
+        results['match_timeslot'] = measure(
+            lambda: utils.match_timeslot(rng.choice(times), grid.room_occupancy),
+            repeat,
+        )
+
+        import app
+        logging.getLogger().setLevel(logging.WARNING)
+        client = app.app.test_client()
+
+        def streamed(*args, **kwargs):
+            # read streamed bodies to the end and close them like a server would
+            response = client.post(*args, **kwargs)
+            response.get_data()
+            response.close()
+            return response
+
+        token = client.post('/selected-file', json={'file': 'Monday', 'selection_type': 'Room'}).headers['X-Selection-Token']
+        routes = {
+            'GET /all-subjects': lambda: client.get('/all-subjects'),
+            'GET /subjects/search': lambda: client.get('/subjects/search', query_string={'q': rng.choice(subjects)[:rng.randint(2, 9)]}),
+            'POST /time-table': lambda: client.post('/time-table', json={'subjects': rng.sample(subjects, rng.randint(6, 8))}),
+            'POST /time-table/batch': lambda: client.post('/time-table/batch', json={'students': [
+                {'id': i, 'subjects': rng.sample(subjects, rng.randint(6, 8))} for i in range(50)]}),
+            'POST /time-table/export': lambda: streamed('/time-table/export', json={'subjects': rng.sample(subjects, rng.randint(6, 8))}),
+            'POST /time-table/export cohort': lambda: streamed('/time-table/export', json={'format': 'csv', 'students': [
+                {'id': i, 'subjects': rng.sample(subjects, rng.randint(6, 8))} for i in range(50)]}),
+            'POST /clashes': lambda: client.post('/clashes', json={'subjects': rng.sample(subjects, rng.randint(6, 8))}),
+            'POST /section-plans': lambda: client.post('/section-plans', json={'courses': [
+                rng.sample(subjects, 4) for _ in range(rng.randint(5, 7))]}),
+            'POST /selected-file': lambda: client.post('/selected-file', json={'file': 'Monday', 'selection_type': 'Room'}),
+            'POST /get-free-room': lambda: client.post('/get-free-room', json={'timeslot': rng.choice(grid.room_timeslots), 'token': token}),
+            'POST /day-free-rooms': lambda: client.post('/day-free-rooms', json={'file': 'Monday', 'selection_type': 'Room'}),
+            'POST /now-empty': lambda: client.post('/now-empty', json={'current-day': 'Monday', 'current-time': rng.choice(times)}),
+            'POST /next-free-slot': lambda: client.post('/next-free-slot', json={'room': 'R-001', 'current-day': 'Monday', 'current-time': rng.choice(times)}),
+            'GET /room-schedule': lambda: client.get('/room-schedule', query_string={'room': f'R-{rng.randint(1, 40):03d}'}),
+            'GET /current-rating': lambda: client.get('/current-rating'),
+        }
+        for name, call in routes.items():
+            response = call()
+            if response.status_code >= 500:
+                raise RuntimeError(f'{name} failed with {response.status_code}: {response.get_data(as_text=True)}')
+            results[name] = measure(call, repeat)
+
+        app.refresh_worker.stop()
+
+    finally:
+        os.chdir(root)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'commit': git_commit(),
+        'scale': scale,
+        'params': scales[scale],
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+def report(report_data, baseline=None):
+    print(f"commit {report_data['commit']}  scale {report_data['scale']}  {report_data['params']}")
+    print(f"{'benchmark':<28}{'p50 ms':>10}{'p99 ms':>10}{'ops/s':>12}" + (f"{'p50 vs base':>14}" if baseline else ''))
+
+    for name, result in report_data['results'].items():
+        line = f"{name:<28}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}{result['throughput']:>12.1f}"
+        if baseline and name in baseline['results']:
+            change = result['p50_ms'] / baseline['results'][name]['p50_ms'] - 1
+            line += f'{change:>+13.1%}'
+        print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the timetable server on synthetic data.')
+    parser.add_argument('--scale', choices=sorted(scales), default='small')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    parser.add_argument('--output', help='where to write the results, defaults to benchmarks/results/<commit>-<scale>.json')
+    args = parser.parse_args()
+
+    report_data = run(args.scale, args.repeat, args.seed)
+
+    output = args.output or os.path.join(root, 'benchmarks', 'results', f"{report_data['commit']}-{args.scale}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report_data, file, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    report(report_data, baseline)
+    print(f'results written to {output}')
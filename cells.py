@@ -0,0 +1,135 @@
+import re
+from functools import lru_cache
+from collections import namedtuple
+import numpy as np
+
+# Regular expression pattern to match time values like "1:30-2:50"
+time_pattern = r'\d+:\d+-\d+:\d+'
+
+# 'OOP (CS-A)', 'Data St Lab (CS 22-A) ReSch' -> course, section and whatever follows
+cell_pattern = re.compile(r'^(?P<course>[^()]*?)\s*\((?P<section>[^()]*)\)\s*(?P<note>.*)$')
+cancel_pattern = re.compile(r'\bcancell?ed\b', re.IGNORECASE)
+# notes of sessions that don't happen every week e.g. '26th Jan Only', 'ReSch (02 Feb)'
+one_off_pattern = re.compile(r'\bonly\b|\bre-?sch|\d', re.IGNORECASE)
+
+# one timetable cell taken apart, instructor / section / time / note are None when the cell has none
+# the first line of a cell holds the subject, further lines the instructor
+Cell = namedtuple('Cell', ['course', 'section', 'instructor', 'cancelled', 'time', 'note'])
+
+# one meeting of a subject in the subject index, note and cancelled are those of its cell
+Meeting = namedtuple('Meeting', ['day', 'time', 'room', 'kind', 'note', 'cancelled'])
+
+def clean(text):
+    return ' '.join(text.split())
+
+@lru_cache(maxsize=1 << 16)
+def parse_cell(value):
+    '''
+        takes a cell apart into a Cell, the same text is only parsed once
+    '''
+    lines = str(value).splitlines() or ['']
+    first = lines[0]
+
+    embedded = re.search(time_pattern, first)
+    time = embedded.group() if embedded else None
+
+    # cancelled sessions count as free, however the word is written
+    cancelled = 'cancel' in first.casefold()
+    first = clean(cancel_pattern.sub('', re.sub(time_pattern, '', first)))
+
+    match = cell_pattern.match(first)
+    if match:
+        course, section, note = clean(match.group('course')), clean(match.group('section')), match.group('note')
+    else:
+        course, section, note = first, None, ''
+
+    instructor = clean(' '.join(lines[1:])) or None
+    return Cell(course, section, instructor, cancelled, time, note or None)
+
+def subject_name(cell):
+    '''
+        name of the subject of a cell as the catalog lists it e.g. 'OOP (CS-A)'
+    '''
+    return f'{cell.course} ({cell.section})' if cell.section is not None else cell.course
+
+def one_off(note):
+    '''
+        whether a cell note makes its session a one-off, a dated, rescheduled or 'Only' session
+    '''
+    return bool(note) and one_off_pattern.search(note) is not None
+
+def subject_key(value):
+    '''
+        lookup key of the subject of a cell or of a requested subject
+        notes, times and cancellations don't change the subject
+    '''
+    return subject_name(parse_cell(value)).casefold()
+
+class Strings:
+    '''
+        interned string pool, every distinct string gets one integer id, 0 is None
+    '''
+    def __init__(self):
+        self.values = [None]
+        self.ids = {None: 0}
+
+    def id(self, value):
+        if value not in self.ids:
+            self.ids[value] = len(self.values)
+            self.values.append(value)
+        return self.ids[value]
+
+class CellTable:
+    '''
+        every filled cell of the timetable as one row of integer columns, strings live once in strings
+        kind, day, slot, room, course, section, instructor, time, note, subject and key are string ids,
+        cancelled is a bool column
+    '''
+    string_columns = ('kind', 'day', 'slot', 'room', 'course', 'section', 'instructor', 'time', 'note', 'subject', 'key')
+
+    def __init__(self, cells):
+        '''
+            cells yields (kind, day, slot, room, text) like utils.iter_cells
+        '''
+        self.strings = Strings()
+        columns = {name: [] for name in self.string_columns}
+        cancelled = []
+
+        for kind, day, slot, room, text in cells:
+            cell = parse_cell(text)
+            name = subject_name(cell)
+
+            values = (kind, day, slot, room, cell.course, cell.section, cell.instructor, cell.time or slot, cell.note,
+                      name, name.casefold())
+            for column, value in zip(self.string_columns, values):
+                columns[column].append(self.strings.id(value))
+            cancelled.append(cell.cancelled)
+
+        for column in self.string_columns:
+            setattr(self, column, np.array(columns[column], dtype=np.int32))
+        self.cancelled = np.array(cancelled, dtype=bool)
+
+    def __len__(self):
+        return len(self.cancelled)
+
+    def string(self, string_id):
+        return self.strings.values[string_id]
+
+    def rows(self, column, value):
+        '''
+            positions of the rows whose column holds value, empty when the value never occurs
+        '''
+        string_id = self.strings.ids.get(value)
+        if string_id is None:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero(getattr(self, column) == string_id)
+
+    def groups(self, column):
+        '''
+            {value: row positions} for every value of a column, the rows of a value stay in table order
+        '''
+        ids = getattr(self, column)
+        order = np.argsort(ids, kind='stable')
+        values, starts = np.unique(ids[order], return_index=True)
+
+        return {self.string(value): rows for value, rows in zip(values, np.split(order, starts[1:])) if value}
@@ -0,0 +1,148 @@
+from collections import defaultdict
+from utils import LRUCache, normalize_subject, parse_timeslot
+
+# results keyed by timetable version and normalized subjects
+clash_cache = LRUCache(maxsize=512)
+
+def subject_intervals(key, subject_index):
+    '''
+        (day, start, end) in minutes of every meeting of a normalized subject, cancelled meetings can't clash
+    '''
+    intervals = []
+    for meeting in subject_index.get(key, []):
+        interval = parse_timeslot(meeting.time)
+        if interval is not None and not meeting.cancelled:
+            intervals.append((meeting.day, interval[0], interval[1]))
+
+    return intervals
+
+def overlapping_pairs(intervals):
+    '''
+        sweeps over (day, start, end, owner) intervals and returns the overlapping pairs of different owners
+        as (owner_a, owner_b, day, interval_a, interval_b); intervals that only touch don't overlap
+    '''
+    by_day = defaultdict(list)
+    for day, start, end, owner in intervals:
+        by_day[day].append((start, end, owner))
+
+    pairs = []
+    for day, day_intervals in by_day.items():
+        day_intervals.sort()
+        active = []
+
+        for start, end, owner in day_intervals:
+            # drop intervals that ended before this one starts
+            active = [item for item in active if item[1] > start]
+            for other_start, other_end, other_owner in active:
+                if other_owner != owner:
+                    pairs.append((other_owner, owner, day, (other_start, other_end), (start, end)))
+            active.append((start, end, owner))
+
+    return pairs
+
+def find_clashes(subjects, subject_index, version=None):
+    '''
+        overlapping meetings between the given subjects
+        returns dicts with both subjects, the day and both times
+    '''
+    names = {}
+    for subject in subjects:
+        names.setdefault(normalize_subject(subject), subject)
+
+    cache_key = ('clashes', version, tuple(sorted(names)))
+    pairs = clash_cache.get(cache_key) if version is not None else None
+
+    if pairs is None:
+        intervals = [(day, start, end, key) for key in names for day, start, end in subject_intervals(key, subject_index)]
+        pairs = overlapping_pairs(intervals)
+        if version is not None:
+            clash_cache.put(cache_key, pairs)
+
+    return [
+        {'subjects': [names[a], names[b]], 'day': day,
+         'times': [format_interval(interval_a), format_interval(interval_b)]}
+        for a, b, day, interval_a, interval_b in pairs
+    ]
+
+def format_interval(interval):
+    def clock(minutes):
+        hour, minute = divmod(minutes, 60)
+        return f'{hour:02d}:{minute:02d}'
+
+    return f'{clock(interval[0])}-{clock(interval[1])}'
+
+def conflict_free_sections(courses, subject_index, limit=10, version=None):
+    '''
+        picks one section per course so that no two picked sections overlap
+        courses is a list of lists of candidate sections e.g. [['OOP (CS-A)', 'OOP (CS-B)'], ['DLD (CS-A)']]
+        returns up to limit plans, each a list with one section per course in course order,
+        plus the candidates that are not in the timetable
+
+        conflicts between candidates come from one sweep over all their meetings, the search then
+        takes the course with the fewest candidates left first and removes every candidate clashing
+        with a pick from the other courses, giving up on a branch as soon as a course runs out
+    '''
+    names = {}
+    domains = []
+    for candidates in courses:
+        keys = []
+        for candidate in candidates:
+            key = normalize_subject(candidate)
+            names.setdefault(key, candidate)
+            if key not in keys:
+                keys.append(key)
+        domains.append(keys)
+
+    cache_key = ('sections', version, tuple(tuple(sorted(keys)) for keys in domains), limit)
+    cached = clash_cache.get(cache_key) if version is not None else None
+
+    if cached is None:
+        cached = search_sections(domains, subject_index, limit)
+        if version is not None:
+            clash_cache.put(cache_key, cached)
+
+    plans, unknown = cached
+    return [[names[key] for key in plan] for plan in plans], [names[key] for key in unknown]
+
+def search_sections(domains, subject_index, limit):
+    unknown = sorted({key for keys in domains for key in keys if key not in subject_index})
+    domains = [[key for key in keys if key in subject_index] for keys in domains]
+
+    # candidate ids are (course, key) so the same section offered for two courses stays apart
+    intervals = [
+        (day, start, end, (course, key))
+        for course, keys in enumerate(domains)
+        for key in keys
+        for day, start, end in subject_intervals(key, subject_index)
+    ]
+    conflicts = defaultdict(set)
+    for a, b, _, _, _ in overlapping_pairs(intervals):
+        conflicts[a].add(b)
+        conflicts[b].add(a)
+
+    plans = []
+
+    def search(remaining, picked):
+        if len(plans) >= limit:
+            return
+        if not remaining:
+            plans.append([picked[course] for course in range(len(domains))])
+            return
+
+        # most constrained course first
+        course = min(remaining, key=lambda c: len(remaining[c]))
+        rest = {c: keys for c, keys in remaining.items() if c != course}
+
+        for key in remaining[course]:
+            clashing = conflicts[(course, key)]
+            pruned = {c: [k for k in keys if (c, k) not in clashing] for c, keys in rest.items()}
+
+            if all(pruned.values()):
+                picked[course] = key
+                search(pruned, picked)
+                del picked[course]
+
+    if all(domains):
+        search(dict(enumerate(domains)), {})
+
+    return plans, unknown
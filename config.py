@@ -2,16 +2,47 @@
 import os
 from datetime import datetime
     
-TOTAL_RATINGS = 0
-SUM_RATING = 0
-AVERAGE = 0
-
-CLASS_DF = None
-LAB_DF = None
-SELECTION_TYPE = None
-
 CREDENTIALS_PATH = 'timetable-api-412213-75a336ca8f77.json'
 TIMETABLE_PATH = os.path.join(os.getcwd(), 'timetable')
+# 'google' syncs from the spreadsheet at URL, 'local' reads worksheets from LOCAL_SHEETS_PATH (offline / tests),
+# 'module:factory' uses the client returned by factory(config) e.g. one talking to a fake Sheets server
+SHEETS_CLIENT = 'google'
+# worksheets fetched at the same time during a refresh
+SHEETS_FETCH_WORKERS = 4
+LOCAL_SHEETS_PATH = os.path.join(os.getcwd(), 'local_sheets')
 URL = 'https://docs.google.com/spreadsheets/d/1feZLJJN4NDjAnqA8J5vHnVGrl9R91-NFGOqAW0gU5h4/edit?usp=sharing'
 TIME = datetime.now()
+# seconds between background timetable refreshes, 0 only refreshes when /update-timetable is called
+REFRESH_INTERVAL = 0
+# seconds between checks of every worker process for timetable files another process downloaded, 0 turns them off
+SOURCE_CHECK_INTERVAL = 2
 SECRET_KEY = 'my_secret_key'
+# sqlite file for feedback and ratings
+DATABASE_PATH = os.path.join(os.getcwd(), 'app_data.db')
+# DEBUG also logs selected subjects and whole generated timetables, WARNING keeps request logging off
+LOG_LEVEL = 'INFO'
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'
+# 'header' profiles requests sent with X-Profile: 1, 'all' profiles every request, 'off' disables profiling
+PROFILE_REQUESTS = 'off'
+# 'cprofile' writes .prof files, 'pyinstrument' html reports when it is installed
+PROFILER = 'cprofile'
+PROFILE_PATH = os.path.join(os.getcwd(), 'profiles')
+# largest number of students accepted by /time-table/batch
+BATCH_MAX_STUDENTS = 10000
+# largest /section-plans request, in courses and in sections offered for one course
+SECTION_PLAN_MAX_COURSES = 12
+SECTION_PLAN_MAX_SECTIONS = 30
+# /time-table bodies of at least this many bytes are gzipped for clients that accept it, None turns compression off
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 5
+# processes parsing timetable files when several have to be parsed, 0 is one per CPU and 1 parses serially
+PARSE_WORKERS = 0
+# below this many bytes of files to parse a process pool costs more than it saves
+PARSE_POOL_MIN_BYTES = 1 << 20
+# term of the calendar exports, TERM_START as 'YYYY-MM-DD', None starts them on the monday of the current week
+TERM_START = None
+TERM_WEEKS = 16
+# time zone of the timetable, for calendar exports
+TIMEZONE = 'Asia/Karachi'
+# timetable versions kept for /changes, clients further behind reload everything
+HISTORY_LIMIT = 50
@@ -0,0 +1,233 @@
+import io
+import re
+import csv
+import hashlib
+import datetime
+from zoneinfo import ZoneInfo
+from cells import one_off
+from utils import LRUCache, meeting_record, normalize_subject, parse_timeslot, timetable_columns
+
+# rendered exports keyed by timetable version, format, term and normalized subjects
+export_cache = LRUCache(maxsize=1024)
+
+weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+months = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+# a date in a cell note e.g. '26th Jan Only', 'ReSch (02 Feb)'
+note_date_pattern = re.compile(r'(\d{1,2})(?:st|nd|rd|th)?\s*([a-z]{3})', re.IGNORECASE)
+
+def term_start(start=None, today=None):
+    '''
+        first day of the term from an ISO date, the monday of this week when there is none
+    '''
+    if start:
+        return datetime.date.fromisoformat(str(start))
+
+    today = today or datetime.date.today()
+    return today - datetime.timedelta(days=today.weekday())
+
+def subject_names(subjects, version):
+    '''
+        {lookup key: catalog name}, exports name subjects the way the catalog does whatever the request spelled
+    '''
+    names = export_cache.get((version, 'names'))
+    if names is None:
+        names = {subject.casefold(): subject for subject in subjects}
+        export_cache.put((version, 'names'), names)
+    return names
+
+def note_date(note, near):
+    '''
+        the date a cell note names, in the year that puts it closest to near, None when it names none
+    '''
+    match = note_date_pattern.search(note or '')
+    if match is None or match.group(2).lower() not in months:
+        return None
+
+    day, month = int(match.group(1)), months.index(match.group(2).lower()) + 1
+    try:
+        dates = [datetime.date(year, month, day) for year in (near.year - 1, near.year, near.year + 1)]
+    except ValueError:
+        return None
+    return min(dates, key=lambda date: abs(date - near))
+
+def escape_text(value):
+    return str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def fold_line(line):
+    '''
+        content line folded at 75 octets as RFC 5545 asks, continuation lines start with a space
+    '''
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+
+    parts = []
+    while data:
+        size = 75 if not parts else 74
+        # don't cut a multi byte character in half
+        while size < len(data) and (data[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(data[:size].decode('utf-8'))
+        data = data[size:]
+
+    return '\r\n '.join(parts) + '\r\n'
+
+def ics_event(record, start, weeks, tzid, stamp, week):
+    '''
+        the lines of one weekly recurring event, None when the day or time can't be placed in the week
+        stamp is the UTC time the calendar is generated at e.g. '20240122T093000Z'
+        week is the monday of the week the timetable is for: a one-off session happens once, on the date
+        its note names or else in that week, and a cancelled weekly session skips that week
+    '''
+    day = record['Day'].rsplit('.', 1)[0]
+    interval = parse_timeslot(record['Time'])
+    if day not in weekdays or interval is None:
+        return None
+
+    this_week = week + datetime.timedelta(days=weekdays.index(day))
+    once = one_off(record['Note'])
+    if once and record['Cancelled']:
+        return None
+
+    if once:
+        first = note_date(record['Note'], this_week) or this_week
+    else:
+        first = start + datetime.timedelta(days=(weekdays.index(day) - start.weekday()) % 7)
+
+    def local(minutes, date=first):
+        hour, minute = divmod(minutes, 60)
+        return f'{date:%Y%m%d}T{hour:02d}{minute:02d}00'
+
+    # the same class in the same room keeps its uid across exports so calendars update it in place
+    uid = hashlib.sha1('|'.join((record['Day'], record['Time'], record['Class'], record['Subject'])).encode('utf-8')).hexdigest()
+
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}@timetable-scheduler',
+        f'DTSTAMP:{stamp}',
+        f'DTSTART;TZID={tzid}:{local(interval[0])}',
+        f'DTEND;TZID={tzid}:{local(interval[1])}',
+    ]
+    if not once:
+        lines.append(f'RRULE:FREQ=WEEKLY;COUNT={weeks}')
+    if not once and record['Cancelled']:
+        lines.append(f'EXDATE;TZID={tzid}:{local(interval[0], this_week)}')
+    lines += [
+        f'SUMMARY:{escape_text(record["Subject"])}',
+        f'LOCATION:{escape_text(record["Class"])}',
+    ]
+    if record['Note']:
+        lines.append(f'DESCRIPTION:{escape_text(record["Note"])}')
+    lines.append('END:VEVENT')
+
+    return ''.join(fold_line(line) for line in lines)
+
+def ics_calendar(records, start, weeks, tzid, week=None):
+    '''
+        yields an iCalendar file chunk by chunk, one weekly event per record for weeks weeks from start
+        week is the monday of the week the timetable is for, this week by default
+    '''
+    week = week or term_start()
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    offset = datetime.datetime.combine(start, datetime.time(12), ZoneInfo(tzid)).utcoffset()
+    hours, minutes = divmod(int(offset.total_seconds()) // 60, 60)
+    utc_offset = f'{"+" if offset >= datetime.timedelta(0) else "-"}{abs(hours):02d}{minutes:02d}'
+
+    yield ''.join(fold_line(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//timetable-scheduler//timetable export//EN',
+        'CALSCALE:GREGORIAN',
+        # the offset of the term start, enough for zones without daylight saving like the university's
+        'BEGIN:VTIMEZONE',
+        f'TZID:{tzid}',
+        'BEGIN:STANDARD',
+        'DTSTART:19700101T000000',
+        f'TZOFFSETFROM:{utc_offset}',
+        f'TZOFFSETTO:{utc_offset}',
+        'END:STANDARD',
+        'END:VTIMEZONE',
+    ])
+
+    for record in records:
+        event = ics_event(record, start, weeks, tzid, stamp, week)
+        if event is not None:
+            yield event
+
+    yield fold_line('END:VCALENDAR')
+
+def csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+def csv_table(records):
+    yield csv_line(timetable_columns)
+    for record in records:
+        yield csv_line([record[column] for column in timetable_columns])
+
+def subject_records(key, subject_index, names):
+    return [meeting_record(meeting, names.get(key, key)) for meeting in subject_index.get(key, [])]
+
+def export_timetable(subjects, subject_index, catalog, version, fmt='ics', start=None, weeks=16, tzid='UTC'):
+    '''
+        yields the timetable of the subjects as an iCalendar ('ics') or csv file chunk by chunk
+        a finished export is cached by the normalized subject set and the timetable version and streamed from there
+    '''
+    if weeks < 1:
+        raise ValueError('weeks must be at least 1')
+
+    keys = sorted({normalize_subject(subject) for subject in subjects})
+    start = term_start(start)
+    # one-off and cancelled sessions are placed in the current week
+    week = term_start()
+
+    cache_key = (version, fmt, start, week, weeks, tzid, tuple(keys))
+    cached = export_cache.get(cache_key)
+    if cached is not None:
+        yield from cached
+        return
+
+    names = subject_names(catalog, version)
+    records = (record for key in keys for record in subject_records(key, subject_index, names))
+    body = ics_calendar(records, start, weeks, tzid, week) if fmt == 'ics' else csv_table(records)
+
+    chunks = []
+    for chunk in body:
+        chunks.append(chunk)
+        yield chunk
+
+    # only complete exports are cached, a client hanging up stops the generator before this
+    export_cache.put(cache_key, chunks)
+
+def export_cohort(students, subject_index, catalog, version):
+    '''
+        yields one csv file with the timetables of many students, an Id column tells them apart
+        students are read one at a time and the rows of each subject are rendered once per version,
+        so memory stays flat however many students are exported
+        students are dicts with subjects and an optional id like /time-table/batch takes, invalid entries
+        and students with subjects that aren't strings are skipped
+    '''
+    names = subject_names(catalog, version)
+    yield csv_line(['Id'] + timetable_columns)
+
+    for position, student in enumerate(students):
+        subjects = student.get('subjects') if isinstance(student, dict) else None
+        if not isinstance(subjects, list) or not all(isinstance(subject, str) for subject in subjects):
+            continue
+
+        student_id = csv_line([student.get('id', position)]).rstrip('\r\n')
+        chunk = []
+        for key in dict.fromkeys(normalize_subject(subject) for subject in subjects):
+            cache_key = (version, 'csv-rows', key)
+            rows = export_cache.get(cache_key)
+            if rows is None:
+                rows = [csv_line([record[column] for column in timetable_columns])
+                        for record in subject_records(key, subject_index, names)]
+                export_cache.put(cache_key, rows)
+
+            chunk.extend(f'{student_id},{row}' for row in rows)
+
+        # one chunk per student
+        yield ''.join(chunk)
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import logging
+import datetime
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from utils import LRUCache, atomic_path, base_path, pa, read_table, write_table
+
+log = logging.getLogger(__name__)
+
+# the cells of every timetable version loaded, one file per version named <created ns>-<version>
+history_folder = os.path.join(base_path, 'timetable_history')
+
+# what is kept of a cell, enough to tell what happened to a class between two versions
+history_columns = ['kind', 'day', 'slot', 'room', 'subject', 'key', 'instructor', 'time']
+
+# diffs keyed by (since, version)
+changes_cache = LRUCache(maxsize=64)
+
+# created is when the version was first loaded
+Snapshot = namedtuple('Snapshot', ['version', 'created', 'path'])
+
+# the history columns of a CellTable as string ids plus its cancelled column, and the strings the ids stand for
+CellColumns = namedtuple('CellColumns', ['columns', 'strings'])
+
+def cell_columns(cells):
+    columns = {column: getattr(cells, column) for column in history_columns}
+    columns['cancelled'] = cells.cancelled
+    return CellColumns(columns, cells.strings.values)
+
+def snapshot_files(folder=history_folder):
+    '''
+        [Snapshot] of the stored versions, oldest first
+    '''
+    if not os.path.isdir(folder):
+        return []
+
+    snapshots = {}
+    for file in sorted(os.listdir(folder)):
+        name, extension = os.path.splitext(file)
+        created, _, version = name.partition('-')
+        if extension not in ('.arrow', '.json') or not created.isdigit() or not version:
+            continue
+
+        # two workers loading the same version at once both store it, the first one counts
+        if version not in snapshots:
+            created = datetime.datetime.fromtimestamp(int(created) / 1e9)
+            snapshots[version] = Snapshot(version, created, os.path.join(folder, file))
+
+    return list(snapshots.values())
+
+def write_cells(path, cells, metadata):
+    '''
+        stores CellColumns compactly, int32 id columns with the strings once in the metadata
+        json without pyarrow
+    '''
+    metadata = {**metadata, 'strings': json.dumps(cells.strings, default=str)}
+
+    if pa is not None:
+        write_table(path, cells.columns, metadata)
+        return
+
+    with atomic_path(path) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({'metadata': metadata, 'columns': {name: values.tolist() for name, values in cells.columns.items()}}, file)
+
+def read_cells(path):
+    '''
+        CellColumns stored by write_cells
+    '''
+    if path.endswith('.arrow'):
+        columns, metadata = read_table(path)
+        return CellColumns(columns, json.loads(metadata[b'strings']))
+
+    with open(path, encoding='utf-8') as file:
+        data = json.load(file)
+    columns = {name: np.array(values, dtype=bool if name == 'cancelled' else np.int32) for name, values in data['columns'].items()}
+    return CellColumns(columns, json.loads(data['metadata']['strings']))
+
+def record_version(model, folder=history_folder, limit=50):
+    '''
+        stores the cells of a loaded timetable under its version unless that version is stored already
+        returns its Snapshot and the changes since the previous version, None when it was stored before
+        only the latest limit versions are kept
+    '''
+    snapshots = snapshot_files(folder)
+    for snapshot in snapshots:
+        if snapshot.version == model.version:
+            return snapshot, None
+
+    cells = cell_columns(model.cells)
+    previous = snapshots[-1] if snapshots else None
+
+    created = time.time_ns()
+    extension = '.arrow' if pa is not None else '.json'
+    path = os.path.join(folder, f'{created:020d}-{model.version}{extension}')
+    write_cells(path, cells, {'version': model.version, 'previous': previous.version if previous else ''})
+
+    changes = diff_cells(read_cells(previous.path), cells) if previous else []
+    if previous:
+        log.info('Timetable version %s has %d changes since %s', model.version, len(changes), previous.version)
+        # the clients polling /changes since the previous version ask for exactly this diff
+        changes_cache.put((previous.version, model.version), changes)
+
+    for snapshot in snapshots[:max(0, len(snapshots) + 1 - limit)]:
+        try:
+            os.remove(snapshot.path)
+        except FileNotFoundError:
+            # another worker pruned it first
+            pass
+
+    return Snapshot(model.version, datetime.datetime.fromtimestamp(created / 1e9), path), changes
+
+def changes_since(since, cells, version, folder=history_folder):
+    '''
+        changes from the stored version since to the loaded cells of version
+        raises KeyError when since is not in the history, it never existed or was pruned
+    '''
+    if since == version:
+        return []
+
+    changes = changes_cache.get((since, version))
+    if changes is None:
+        paths = {snapshot.version: snapshot.path for snapshot in snapshot_files(folder)}
+        try:
+            old = read_cells(paths[since])
+        except FileNotFoundError:
+            # pruned by another worker in the meantime
+            raise KeyError(since)
+        changes = diff_cells(old, cell_columns(cells))
+        changes_cache.put((since, version), changes)
+
+    return changes
+
+def group_codes(columns, names, base, rows):
+    '''
+        one integer per row, equal for the rows that hold equal ids in every named column
+        ids are below base
+    '''
+    codes = np.zeros(len(rows), dtype=np.int64)
+    bound = 1
+    for name in names:
+        # as many columns as fit are packed into one int64 before it is renumbered
+        if bound * base >= 1 << 62:
+            codes, uniques = pd.factorize(codes)
+            bound = len(uniques)
+        codes = codes * base + columns[name][rows]
+        bound *= base
+    return pd.factorize(codes)[0]
+
+def occurrences(codes):
+    '''
+        how many rows before each row have the same code
+    '''
+    order = np.argsort(codes, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+    sizes = np.diff(np.r_[starts, len(codes)])
+
+    ranks = np.empty(len(codes), dtype=np.int64)
+    ranks[order] = np.arange(len(codes)) - np.repeat(starts, sizes)
+    return ranks
+
+def match_rows(columns, names, base, old_rows, new_rows):
+    '''
+        pairs old and new rows holding the same ids in the named columns,
+        the n-th old row of a combination with its n-th new row
+        returns the matched old and new rows
+    '''
+    codes = group_codes(columns, names, base, np.concatenate([old_rows, new_rows]))
+    old_codes, new_codes = codes[:len(old_rows)], codes[len(old_rows):]
+    old_ranks, new_ranks = occurrences(old_codes), occurrences(new_codes)
+
+    width = max(old_ranks.max(initial=0), new_ranks.max(initial=0)) + 1
+    _, old_found, new_found = np.intersect1d(old_codes * width + old_ranks, new_codes * width + new_ranks,
+                                             assume_unique=True, return_indices=True)
+    return old_rows[old_found], new_rows[new_found]
+
+def cell_record(columns, strings, row):
+    return {'kind': strings[columns['kind'][row]], 'day': strings[columns['day'][row]], 'time': strings[columns['time'][row]],
+            'room': strings[columns['room'][row]], 'instructor': strings[columns['instructor'][row]],
+            'cancelled': bool(columns['cancelled'][row])}
+
+def shared_ids(old, new):
+    '''
+        the columns of two CellColumns one after the other with ids into one list of strings
+        the new ids stay as they are, old strings the new version doesn't have are added after its strings
+    '''
+    strings = list(new.strings)
+    ids = {value: string_id for string_id, value in enumerate(strings)}
+
+    translate = np.empty(len(old.strings), dtype=np.int64)
+    for string_id, value in enumerate(old.strings):
+        if value not in ids:
+            ids[value] = len(strings)
+            strings.append(value)
+        translate[string_id] = ids[value]
+
+    columns = {column: np.concatenate([translate[old.columns[column]], new.columns[column]]) for column in history_columns}
+    columns['cancelled'] = np.concatenate([old.columns['cancelled'], new.columns['cancelled']])
+    return columns, strings
+
+def diff_cells(old, new):
+    '''
+        cell level changes between two CellColumns
+        returns dicts with the type of change, the subject and the cell before ('from') and after ('to')
+        types: cancelled, reinstated, room_changed, instructor_changed, changed (same class at the same time)
+        moved (the class is held at another day / time), removed, added
+
+        both versions share one set of string ids so rows are compared as integers, rows are matched
+        in passes: identical rows first, then the same class at the same day and time, then the same
+        class anywhere, what is left was removed or added
+    '''
+    both, strings = shared_ids(old, new)
+    size = len(old.columns['cancelled'])
+    old_rows = np.arange(size)
+    new_rows = np.arange(size, len(both['cancelled']))
+    base = len(strings)
+
+    changes = []
+
+    def remove(rows, matched):
+        return rows[~np.isin(rows, matched)]
+
+    def add(kind, old_matched, new_matched):
+        for change, old_row, new_row in zip(kind, old_matched, new_matched):
+            changes.append({'type': str(change), 'subject': strings[both['subject'][new_row]],
+                            'from': cell_record(both, strings, old_row), 'to': cell_record(both, strings, new_row)})
+
+    # the same cell on both sides is no change
+    old_matched, new_matched = match_rows(both, history_columns + ['cancelled'], base, old_rows, new_rows)
+    old_rows, new_rows = remove(old_rows, old_matched), remove(new_rows, new_matched)
+
+    old_matched, new_matched = match_rows(both, ['kind', 'key', 'day', 'time'], base, old_rows, new_rows)
+    was_cancelled, is_cancelled = both['cancelled'][old_matched], both['cancelled'][new_matched]
+    kind = np.select(
+        [is_cancelled & ~was_cancelled, was_cancelled & ~is_cancelled,
+         both['room'][old_matched] != both['room'][new_matched],
+         both['instructor'][old_matched] != both['instructor'][new_matched]],
+        ['cancelled', 'reinstated', 'room_changed', 'instructor_changed'],
+        'changed',
+    )
+    add(kind, old_matched, new_matched)
+    old_rows, new_rows = remove(old_rows, old_matched), remove(new_rows, new_matched)
+
+    old_matched, new_matched = match_rows(both, ['kind', 'key'], base, old_rows, new_rows)
+    add(['moved'] * len(old_matched), old_matched, new_matched)
+    old_rows, new_rows = remove(old_rows, old_matched), remove(new_rows, new_matched)
+
+    for row in old_rows:
+        changes.append({'type': 'removed', 'subject': strings[both['subject'][row]],
+                        'from': cell_record(both, strings, row), 'to': None})
+    for row in new_rows:
+        changes.append({'type': 'added', 'subject': strings[both['subject'][row]],
+                        'from': None, 'to': cell_record(both, strings, row)})
+
+    return changes
@@ -0,0 +1,34 @@
+import uuid
+import logging
+from flask import g, has_request_context, request
+
+class RequestIdFilter(logging.Filter):
+    '''
+        stamps every record with the id of the request it was logged in, '-' outside of requests
+    '''
+    def filter(self, record):
+        record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+def configure_logging(app):
+    '''
+        one handler on the root logger at LOG_LEVEL, formatted with LOG_FORMAT
+        messages use %-style arguments so nothing is formatted for records below the level
+    '''
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(app.config['LOG_FORMAT']))
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(app.config['LOG_LEVEL'])
+
+    @app.before_request
+    def assign_request_id():
+        # keep the id of a proxy / client when one is sent
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12]
+
+    @app.after_request
+    def echo_request_id(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '-')
+        return response
@@ -0,0 +1,171 @@
+import os
+import time
+import uuid
+import cProfile
+import threading
+from contextlib import contextmanager
+
+try:
+    # optional, PROFILER = 'pyinstrument' writes html reports instead of .prof files
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# upper bounds in seconds of the latency histogram buckets
+buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+class Metrics:
+    '''
+        in process counters and latency histograms rendered in the prometheus text format
+        every worker process keeps its own numbers, scrape each worker or sum them in prometheus
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._descriptions = {}
+        self._collectors = []
+
+        if hasattr(os, 'register_at_fork'):
+            # a forked child starts with one thread, the lock may have been held by another one
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, description):
+        self._descriptions[name] = (kind, description)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # one count per bucket, then sum and count
+                histogram = self._histograms[key] = [0] * len(buckets) + [0.0, 0]
+
+            for position, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[position] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, collector):
+        '''
+            collector() returns (name, labels dict, value) samples read at scrape time, e.g. cache sizes
+        '''
+        self._collectors.append(collector)
+
+    def render(self):
+        samples = {}
+
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                samples.setdefault(name, []).append(f'{name}{format_labels(labels)} {value}')
+
+            for (name, labels), histogram in self._histograms.items():
+                lines = samples.setdefault(name, [])
+                for bound, count in zip(buckets, histogram):
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {count}')
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {histogram[-1]}')
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram[-2]}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram[-1]}')
+
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                samples.setdefault(name, []).append(f'{name}{format_labels(tuple(sorted(labels.items())))} {value}')
+
+        output = []
+        for name in sorted(samples):
+            if name in self._descriptions:
+                kind, description = self._descriptions[name]
+                output.append(f'# HELP {name} {description}')
+                output.append(f'# TYPE {name} {kind}')
+            output.extend(samples[name])
+
+        return '\n'.join(output) + '\n'
+
+metrics = Metrics()
+metrics.describe('http_requests_total', 'counter', 'Requests handled by route, method and status.')
+metrics.describe('http_request_duration_seconds', 'histogram', 'Request latency by route and method.')
+metrics.describe('timetable_stage_seconds', 'histogram', 'Time spent in timetable processing stages.')
+metrics.describe('timetable_refreshes_total', 'counter', 'Timetable refresh jobs by result.')
+
+def stage_timer(stage):
+    '''
+        times a processing stage e.g. with stage_timer('excel_parse'): ...
+    '''
+    return metrics.timer('timetable_stage_seconds', stage=stage)
+
+def instrument(app):
+    '''
+        times every request and profiles the ones PROFILE_REQUESTS asks for
+        'header' profiles requests sent with X-Profile: 1, 'all' profiles every request, 'off' none
+    '''
+    from flask import g, request
+
+    def should_profile():
+        mode = app.config['PROFILE_REQUESTS']
+        return mode == 'all' or (mode == 'header' and request.headers.get('X-Profile') == '1')
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+        if should_profile():
+            if app.config['PROFILER'] == 'pyinstrument' and Profiler is not None:
+                g.profiler = Profiler()
+                g.profiler.start()
+            else:
+                g.profiler = cProfile.Profile()
+                g.profiler.enable()
+
+    @app.after_request
+    def record_request(response):
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+        if 'request_start' in g:
+            elapsed = time.perf_counter() - g.request_start
+            metrics.observe('http_request_duration_seconds', elapsed, route=route, method=request.method)
+        metrics.inc('http_requests_total', route=route, method=request.method, status=response.status_code)
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            os.makedirs(app.config['PROFILE_PATH'], exist_ok=True)
+            name = g.get('request_id') or uuid.uuid4().hex[:12]
+
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+                file = f'{name}.prof'
+                profiler.dump_stats(os.path.join(app.config['PROFILE_PATH'], file))
+            else:
+                profiler.stop()
+                file = f'{name}.html'
+                with open(os.path.join(app.config['PROFILE_PATH'], file), 'w') as report:
+                    report.write(profiler.output_html())
+
+            response.headers['X-Profile'] = file
+
+        return response
@@ -0,0 +1,95 @@
+import uuid
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+class RefreshWorker:
+    '''
+        runs timetable refreshes one at a time on a background thread
+        a refresh asked for while another one is still queued joins the queued job instead of adding a new one
+        job records are kept in memory for the status route, the oldest are dropped after max_jobs
+    '''
+    def __init__(self, refresh, max_jobs=50):
+        self._refresh = refresh
+        self._max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._queued = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='timetable-refresh')
+        self._timer = None
+
+    def submit(self):
+        '''
+            queues a refresh and returns its job id
+        '''
+        with self._lock:
+            if self._queued is not None:
+                return self._queued
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'submitted': now(),
+                'started': None,
+                'finished': None,
+                'result': None,
+                'error': None,
+            }
+            while len(self._jobs) > self._max_jobs:
+                self._jobs.popitem(last=False)
+
+            self._queued = job_id
+
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def _run(self, job_id):
+        with self._lock:
+            self._queued = None
+            job = self._jobs.get(job_id)
+            if job is None:
+                job = self._jobs[job_id] = {'id': job_id}
+            job.update(status='running', started=now())
+
+        try:
+            result = self._refresh()
+        except Exception as e:
+            log.exception('Timetable refresh %s failed', job_id)
+            with self._lock:
+                job.update(status='failed', finished=now(), error=str(e))
+        else:
+            with self._lock:
+                job.update(status='done', finished=now(), result=result)
+
+    def status(self, job_id):
+        '''
+            copy of the job record, None for an unknown job
+        '''
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def schedule(self, interval):
+        '''
+            queues a refresh every interval seconds until stop() is called
+        '''
+        def tick():
+            self.submit()
+            self.schedule(interval)
+
+        self._timer = threading.Timer(interval, tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._executor.shutdown(wait=False)
+
+def now():
+    return datetime.datetime.now().isoformat()
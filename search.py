@@ -0,0 +1,103 @@
+import re
+import bisect
+
+def fold(text):
+    return ' '.join(str(text).split()).casefold()
+
+def trigrams(text):
+    '''
+        trigrams of a folded string padded so the start of the string and of every word count
+    '''
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def prefix_range(keys, prefix):
+    '''
+        start and end of the keys starting with prefix in a sorted list
+    '''
+    start = bisect.bisect_left(keys, prefix)
+    # every key starting with prefix sorts before prefix followed by the highest character
+    return start, bisect.bisect_left(keys, prefix + '\U0010ffff', start)
+
+class SubjectSearch:
+    '''
+        autocomplete over the subject catalog, built once per timetable load
+        matches rank as: start of the name, start of any other word, then fuzzy matches by shared trigrams
+        prefix matches are ranges of sorted arrays found by bisect, so they come out alphabetically and
+        cost the same for any catalog size, typos fall through to a trigram index
+    '''
+    def __init__(self, subjects, min_similarity=0.3):
+        self.subjects = list(subjects)
+        self.min_similarity = min_similarity
+        folded = [fold(subject) for subject in self.subjects]
+
+        names = sorted((name, subject_id) for subject_id, name in enumerate(folded))
+        self._names = [name for name, _ in names]
+        self._name_ids = [subject_id for _, subject_id in names]
+
+        # the text from every later word onwards, words start at letters and digits
+        # so '(CS-A)' is found by 'cs-a' and by 'a'
+        words = sorted(
+            (name[word.start():], subject_id)
+            for subject_id, name in enumerate(folded)
+            for word in list(re.finditer(r'\b\w', name))[1:]
+        )
+        self._words = [word for word, _ in words]
+        self._word_ids = [subject_id for _, subject_id in words]
+
+        self._grams = [trigrams(name) for name in folded]
+        self._postings = {}
+        for subject_id, grams in enumerate(self._grams):
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(subject_id)
+
+        # grams in more subjects than this only add candidates that the rarer grams rank anyway
+        self._common = max(50, len(self.subjects) // 20)
+
+    def fuzzy_matches(self, query):
+        '''
+            (similarity, subject id) of subjects sharing enough trigrams with query, dice coefficient
+        '''
+        grams = trigrams(query)
+        rare = [gram for gram in grams if len(self._postings.get(gram, ())) <= self._common]
+
+        candidates = set()
+        for gram in rare or grams:
+            candidates.update(self._postings.get(gram, ()))
+
+        for subject_id in candidates:
+            subject_grams = self._grams[subject_id]
+            similarity = 2 * len(grams & subject_grams) / (len(grams) + len(subject_grams))
+            if similarity >= self.min_similarity:
+                yield similarity, subject_id
+
+    def search(self, query, limit=10):
+        '''
+            up to limit subjects matching query, best first
+        '''
+        query = fold(query)
+        if not query or limit <= 0:
+            return []
+
+        found = {}
+
+        start, end = prefix_range(self._names, query)
+        for subject_id in self._name_ids[start:min(end, start + limit)]:
+            found[subject_id] = None
+
+        start, end = prefix_range(self._words, query)
+        for subject_id in self._word_ids[start:end]:
+            if len(found) >= limit:
+                break
+            found.setdefault(subject_id)
+
+        # fuzzy matching is only needed to fill up the results
+        if len(found) < limit:
+            fuzzy = sorted(
+                (-similarity, self.subjects[subject_id], subject_id)
+                for similarity, subject_id in self.fuzzy_matches(query) if subject_id not in found
+            )
+            for _, _, subject_id in fuzzy[:limit - len(found)]:
+                found[subject_id] = None
+
+        return [self.subjects[subject_id] for subject_id in found]
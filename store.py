@@ -0,0 +1,196 @@
+import os
+import csv
+import json
+import atexit
+import logging
+import sqlite3
+import datetime
+import threading
+from abc import ABC, abstractmethod
+from contextlib import closing
+
+log = logging.getLogger(__name__)
+
+def connect(path, **kwargs):
+    '''
+        sqlite connection in WAL mode, readers never block the writer and several workers can share the file
+    '''
+    conn = sqlite3.connect(path, timeout=30, **kwargs)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+class BufferedWriter(ABC):
+    '''
+        rows added in requests are buffered in memory and written in batches by a background thread,
+        so adding costs the same no matter how slow the storage behind write() is
+    '''
+    def __init__(self, name, batch_size=100, flush_interval=1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+        self._thread = threading.Thread(target=self._flush_loop, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    @abstractmethod
+    def write(self, rows):
+        '''
+            stores a batch of rows, called from the flush thread
+        '''
+
+    def add_row(self, row):
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        '''
+            writes everything buffered so far in one go
+        '''
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+
+        if not rows:
+            return
+
+        try:
+            self.write(rows)
+        except Exception:
+            # keep them for the next attempt
+            with self._lock:
+                self._buffer[:0] = rows
+            raise
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception('%s could not write, will retry', self._thread.name)
+
+class FeedbackStore(BufferedWriter):
+    '''
+        append-only feedback store on SQLite
+        submissions are buffered and written in batches, so submitting costs the same
+        no matter how much feedback is already stored
+    '''
+    def __init__(self, path, batch_size=100, flush_interval=1.0):
+        self.path = path
+
+        with closing(connect(path)) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS feedback ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, created TEXT NOT NULL, data TEXT NOT NULL)')
+
+        super().__init__('feedback-writer', batch_size, flush_interval)
+
+    def add(self, data):
+        self.add_row((datetime.datetime.now().isoformat(), json.dumps(data)))
+
+    def write(self, rows):
+        # one transaction per batch
+        with closing(connect(self.path)) as conn, conn:
+            conn.executemany('INSERT INTO feedback (created, data) VALUES (?, ?)', rows)
+
+    def count(self):
+        with closing(connect(self.path)) as conn:
+            return conn.execute('SELECT COUNT(*) FROM feedback').fetchone()[0]
+
+    def export(self):
+        '''
+            yields every stored feedback oldest first, with its submission time under 'created'
+        '''
+        self.flush()
+
+        with closing(connect(self.path)) as conn:
+            for created, data in conn.execute('SELECT created, data FROM feedback ORDER BY id'):
+                yield {'created': created, **json.loads(data)}
+
+    def import_csv(self, csv_file):
+        '''
+            one time import of the feedback_data.csv written by older versions, skipped when the store has data
+        '''
+        if not os.path.exists(csv_file):
+            return 0
+
+        with open(csv_file, newline='') as file:
+            rows = [('', json.dumps(row)) for row in csv.DictReader(file)]
+
+        with closing(connect(self.path)) as conn:
+            # check and insert in one write transaction so two workers starting together import once
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('SELECT COUNT(*) FROM feedback').fetchone()[0]:
+                conn.rollback()
+                return 0
+
+            conn.executemany('INSERT INTO feedback (created, data) VALUES (?, ?)', rows)
+            conn.commit()
+
+        return len(rows)
+
+class RatingStore:
+    '''
+        number of votes per star on SQLite, shared by all workers and kept across restarts
+        a vote is a single atomic upsert, the aggregate is cached until any connection writes to the database
+    '''
+    stars = range(1, 6)
+
+    def __init__(self, path):
+        self.path = path
+
+        with closing(connect(path)) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS ratings (rating INTEGER PRIMARY KEY, count INTEGER NOT NULL)')
+
+        # long lived reader, its data_version changes whenever another connection commits
+        self._reader = connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._version = None
+        self._aggregate = None
+
+    def add(self, rating):
+        with closing(connect(self.path)) as conn, conn:
+            conn.execute('INSERT INTO ratings (rating, count) VALUES (?, 1) '
+                         'ON CONFLICT(rating) DO UPDATE SET count = count + 1', (rating,))
+
+    def aggregate(self):
+        '''
+            total votes, average and the number of votes per star
+        '''
+        with self._lock:
+            version = self._reader.execute('PRAGMA data_version').fetchone()[0]
+
+            if version != self._version or self._aggregate is None:
+                counts = dict(self._reader.execute('SELECT rating, count FROM ratings').fetchall())
+                histogram = {str(star): counts.get(star, 0) for star in self.stars}
+
+                total = sum(counts.values())
+                average = sum(star * count for star, count in counts.items()) / total if total else 0
+
+                self._aggregate = {'total': total, 'average': average, 'histogram': histogram}
+                self._version = version
+
+            return self._aggregate
+
+class EmailList(BufferedWriter):
+    '''
+        subscribed emails appended to a text file one per line, written in batches off the request thread
+    '''
+    def __init__(self, path, batch_size=100, flush_interval=1.0):
+        self.path = path
+        super().__init__('email-writer', batch_size, flush_interval)
+
+    def add(self, email):
+        self.add_row(f'{email}\n')
+
+    def write(self, rows):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a') as file:
+            file.writelines(rows)
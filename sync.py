@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from utils import atomic_path, csv_rows, day_files, output_folder, snapshot_folder, timetable_days, write_day, xlsx_rows
+
+log = logging.getLogger(__name__)
+
+# what the last sync saw, lets the next one skip unchanged worksheets
+sync_state_path = os.path.join(snapshot_folder, 'sync_state.json')
+
+class LocalSheetsClient:
+    '''
+        offline stand-in for the gspread client
+        every xlsx / csv file in a folder is served as one worksheet of the spreadsheet
+    '''
+    def __init__(self, folder):
+        self.folder = folder
+
+    def open_by_url(self, url):
+        return LocalSpreadsheet(self.folder)
+
+class LocalSpreadsheet:
+    def __init__(self, folder):
+        self.folder = folder
+        self.title = os.path.basename(os.path.normpath(folder))
+
+    def _files(self):
+        return sorted(file for file in os.listdir(self.folder) if file.endswith(('.xlsx', '.csv')))
+
+    def get_lastUpdateTime(self):
+        mtimes = [os.path.getmtime(os.path.join(self.folder, file)) for file in self._files()]
+        modified = datetime.datetime.fromtimestamp(max(mtimes, default=0), datetime.timezone.utc)
+        return modified.isoformat()
+
+    def worksheets(self):
+        return [LocalWorksheet(os.path.join(self.folder, file)) for file in self._files()]
+
+class LocalWorksheet:
+    def __init__(self, path):
+        self.path = path
+        self.title = os.path.splitext(os.path.basename(path))[0]
+
+    def get_all_values(self):
+        # same shape as gspread, a list of rows of strings with '' for empty cells
+        rows = csv_rows(self.path) if self.path.endswith('.csv') else xlsx_rows(self.path)
+        return [['' if value is None else str(value) for value in row] for row in rows]
+
+def load_sync_state(path=sync_state_path):
+    if not os.path.exists(path):
+        return {'modified': None, 'hashes': {}}
+
+    with open(path) as file:
+        return json.load(file)
+
+def save_sync_state(state, path=sync_state_path):
+    with atomic_path(path) as tmp_path, open(tmp_path, 'w') as file:
+        json.dump(state, file)
+
+def worksheet_hash(values):
+    return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+def fetch_worksheets(worksheets, workers=4):
+    '''
+        values of every worksheet, fetched by up to workers threads at a time
+        returns (title, values) in the order of the worksheets
+    '''
+    if workers <= 1 or len(worksheets) <= 1:
+        return [(worksheet.title, worksheet.get_all_values()) for worksheet in worksheets]
+
+    # every fetch is a blocking API call, the threads just wait on the network together
+    with ThreadPoolExecutor(max_workers=min(workers, len(worksheets)), thread_name_prefix='sheets-fetch') as pool:
+        values = list(pool.map(lambda worksheet: worksheet.get_all_values(), worksheets))
+
+    return [(worksheet.title, worksheet_values) for worksheet, worksheet_values in zip(worksheets, values)]
+
+def sync_timetable(client, spreadsheet_url, folder=output_folder, state_path=sync_state_path, workers=4):
+    '''
+        stores the day worksheets that changed since the last sync in folder, see utils.write_day
+        the spreadsheet modified time skips the whole sync when nothing was edited,
+        otherwise a content hash per worksheet decides which files get rewritten
+        worksheets are fetched concurrently by up to workers threads
+        returns the days whose file was rewritten
+    '''
+    state = load_sync_state(state_path)
+
+    spreadsheet = client.open_by_url(spreadsheet_url)
+    log.info('Syncing spreadsheet %s', spreadsheet.title)
+
+    modified = spreadsheet.get_lastUpdateTime()
+    stored = dict(day_files(folder)) if os.path.exists(folder) else {}
+    if modified == state['modified'] and all(day in stored for day in state['hashes']):
+        return []
+
+    # Check if the folder already exists
+    if not os.path.exists(folder):
+        # Create the folder if it doesn't exist
+        os.makedirs(folder)
+
+    changed = []
+    hashes = {}
+
+    # only day sheets make it into the timetable
+    worksheets = [worksheet for worksheet in spreadsheet.worksheets() if worksheet.title in timetable_days]
+
+    for title, values in fetch_worksheets(worksheets, workers):
+        digest = worksheet_hash(values)
+        hashes[title] = digest
+
+        if state['hashes'].get(title) == digest and title in stored:
+            continue
+
+        # the values go straight into the compact format, no xlsx in between
+        path = write_day(values, folder, title)
+        changed.append(title)
+
+        log.info('Sheet "%s" changed and saved as %s', title, path)
+
+    save_sync_state({'modified': modified, 'hashes': hashes}, state_path)
+
+    return changed
@@ -0,0 +1,57 @@
+import os
+import sys
+import glob
+import shutil
+import importlib
+import pytest
+
+# the modules live at the top of the repository
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+# the timetable files shipped with the repository
+shipped_files = sorted(glob.glob(os.path.join(root, 'timetable', '*.xlsx')))
+
+def copy_timetable(folder):
+    '''
+        copies the shipped timetable into folder and points utils at the copy
+        returns the undo function
+    '''
+    import utils
+    
+    os.makedirs(os.path.join(folder, 'timetable'))
+    for file in shipped_files:
+        shutil.copy(file, os.path.join(folder, 'timetable'))
+    
+    patch = pytest.MonkeyPatch()
+    patch.setattr(utils, 'timetable', os.path.join(folder, 'timetable'))
+    patch.setattr(utils, 'output_folder', os.path.join(folder, 'timetable'))
+    patch.setattr(utils, 'snapshot_folder', os.path.join(folder, 'timetable_snapshot'))
+    return patch.undo
+
+@pytest.fixture
+def shipped_timetable(tmp_path):
+    '''
+        folder of a copy of the shipped timetable that preprocess reads
+    '''
+    undo = copy_timetable(str(tmp_path))
+    yield str(tmp_path / 'timetable')
+    undo()
+
+@pytest.fixture(scope='session')
+def client(tmp_path_factory):
+    '''
+        test client of the app serving a copy of the shipped timetable, the app keeps its data in a temporary folder
+    '''
+    folder = tmp_path_factory.mktemp('app')
+    undo = copy_timetable(str(folder))
+    cwd = os.getcwd()
+    os.chdir(folder)
+    
+    app = importlib.import_module('app')
+    yield app.app.test_client()
+    
+    app.refresh_worker.stop()
+    app.reload_worker.stop()
+    os.chdir(cwd)
+    undo()
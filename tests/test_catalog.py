@@ -0,0 +1,33 @@
+from cells import subject_key
+from utils import build_timetable, catalog_version, parse_rows, preprocess, split_sheet
+from conftest import shipped_files
+
+def raw_subjects(file):
+    '''
+        keys of every filled class and lab cell of a timetable file, merged sub-columns included
+    '''
+    _, class_rows, _, lab_rows = split_sheet(parse_rows(file))
+    return {subject_key(value) for row in class_rows + lab_rows for value in row[1:] if value is not None}
+
+def test_catalog_lists_every_subject_of_the_shipped_timetable(shipped_timetable):
+    _, _, _, _, subjects = preprocess()
+    
+    expected = set().union(*map(raw_subjects, shipped_files)) - {''}
+    assert {subject.casefold() for subject in subjects} == expected
+    # lab sessions in the unnamed sub-columns of Friday's 08:30-11:15 header
+    assert {'DB Lab (SE-D)', 'SDA Lab (SE-G)'} <= set(subjects)
+
+def test_catalog_etag_follows_the_catalog(shipped_timetable):
+    model = build_timetable()
+    
+    assert model.subjects_etag == catalog_version(model.subjects) == build_timetable().subjects_etag
+    assert catalog_version(model.subjects[1:]) != model.subjects_etag
+
+def test_all_subjects_revalidates_with_the_etag(client):
+    response = client.get('/all-subjects')
+    assert response.status_code == 200
+    assert 'DB Lab (SE-D)' in response.get_json()
+    
+    etag = response.headers['ETag']
+    assert client.get('/all-subjects', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/all-subjects', headers={'If-None-Match': '"stale"'}).status_code == 200
@@ -0,0 +1,46 @@
+from cells import Cell, CellTable, Meeting, one_off, parse_cell, subject_key
+from utils import build_subject_index, meeting_record
+
+def test_parse_cell():
+    assert parse_cell('OOP (CS-A)') == Cell('OOP', 'CS-A', None, False, None, None)
+    assert parse_cell('Fund of SPM (CS-A) 26th Jan Only') == Cell('Fund of SPM', 'CS-A', None, False, None, '26th Jan Only')
+    assert parse_cell('AP  (23-A) Cancelled\nAli Khan') == Cell('AP', '23-A', 'Ali Khan', True, None, None)
+    assert parse_cell('Ideol & Const of Pak (CS-B) 11:30-01:15') == \
+        Cell('Ideol & Const of Pak', 'CS-B', None, False, '11:30-01:15', None)
+    assert parse_cell('Seminar') == Cell('Seminar', None, None, False, None, None)
+
+def test_notes_and_cancellations_keep_the_subject():
+    assert subject_key('DLD Lab (SE-B) ReSch (02 Feb)') == subject_key('dld lab (SE-B)') == 'dld lab (se-b)'
+    assert subject_key('AP (23-A) Cancelled') == 'ap (23-a)'
+
+def test_one_off_notes():
+    assert one_off('26th Jan Only')
+    assert one_off('ReSch (02 Feb)')
+    assert one_off('ReSch')
+    assert not one_off(None)
+    assert not one_off('Makeup')
+
+def test_subject_index_keeps_notes_and_cancelled_meetings():
+    cells = CellTable([
+        ('Room', 'Tuesday.xlsx', '02:30-03:50', 'C-307', 'AP (23-A) Cancelled'),
+        ('Room', 'Thursday.xlsx', '02:30-03:50', 'C-410', 'AP (23-A)'),
+        ('Room', 'Friday.xlsx', '10:00-11:20', 'C-301', 'Fund of SPM (CS-A) 26th Jan Only'),
+    ])
+    subject_index = build_subject_index(cells)
+    
+    assert subject_index['ap (23-a)'] == [Meeting('Tuesday.xlsx', '02:30-03:50', 'C-307', 'Room', None, True),
+                                          Meeting('Thursday.xlsx', '02:30-03:50', 'C-410', 'Room', None, False)]
+    
+    record = meeting_record(subject_index['fund of spm (cs-a)'][0], 'Fund of SPM (CS-A)')
+    assert record == {'Day': 'Friday.xlsx', 'Time': '10:00-11:20', 'Class': 'C-301', 'Subject': 'Fund of SPM (CS-A)',
+                      'Start_Time': '10:00', 'End_Time': '11:20', 'Note': '26th Jan Only', 'Cancelled': False}
+
+def test_time_table_shows_notes_and_cancelled_sessions(client):
+    records = client.post('/time-table', json={'subjects': ['AP (23-A)', 'Fund of SPM (CS-A)']}).get_json()
+    
+    assert {(record['Day'], record['Class'], record['Note'], record['Cancelled']) for record in records} >= {
+        ('Tuesday.xlsx', 'C-307', None, True),
+        ('Friday.xlsx', 'C-301', '26th Jan Only', False),
+    }
+    # a cancelled session can't clash
+    assert client.post('/clashes', json={'subjects': ['AP (23-A)', 'Fund of SPM (CS-A)']}).get_json() == {'clashes': []}
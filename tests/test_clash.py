@@ -0,0 +1,76 @@
+import random
+import itertools
+from cells import Meeting
+from clash import find_clashes, search_sections, subject_intervals
+
+timeslots = ['08:30-09:50', '09:00-10:20', '10:00-11:20', '11:20-12:50', '11:30-01:15', '01:00-02:20']
+days = ['Monday.xlsx', 'Tuesday.xlsx']
+
+def meeting(day, time, cancelled=False):
+    return Meeting(day, time, 'C-301', 'Room', None, cancelled)
+
+def random_index(rng, subjects):
+    return {
+        f'subject {i}': [meeting(rng.choice(days), rng.choice(timeslots)) for _ in range(rng.randint(1, 3))]
+        for i in range(subjects)
+    }
+
+def clash(a, b, subject_index):
+    return any(day_a == day_b and start_a < end_b and start_b < end_a
+               for day_a, start_a, end_a in subject_intervals(a, subject_index)
+               for day_b, start_b, end_b in subject_intervals(b, subject_index))
+
+def brute_force(domains, subject_index):
+    return {
+        plan for plan in itertools.product(*domains)
+        if not any(clash(a, b, subject_index) for a, b in itertools.combinations(plan, 2))
+    }
+
+def test_search_sections_finds_every_conflict_free_plan():
+    rng = random.Random(7)
+
+    for _ in range(200):
+        subject_index = random_index(rng, 12)
+        keys = sorted(subject_index)
+        domains = [rng.sample(keys, rng.randint(1, 4)) for _ in range(rng.randint(1, 4))]
+
+        plans, unknown = search_sections(domains, subject_index, limit=10 ** 6)
+
+        assert unknown == []
+        assert len(plans) == len({tuple(plan) for plan in plans})
+        assert {tuple(plan) for plan in plans} == brute_force(domains, subject_index)
+
+def test_search_sections_stops_at_limit_and_reports_unknown_sections():
+    subject_index = {'a': [meeting('Monday.xlsx', '08:30-09:50')],
+                     'b': [meeting('Monday.xlsx', '10:00-11:20')],
+                     'c': [meeting('Tuesday.xlsx', '10:00-11:20')]}
+
+    plans, unknown = search_sections([['a', 'b', 'missing'], ['c']], subject_index, limit=1)
+
+    assert len(plans) == 1
+    assert unknown == ['missing']
+
+def test_touching_meetings_do_not_clash():
+    subject_index = {'oop (cs-a)': [meeting('Monday.xlsx', '10:00-11:20')],
+                     'dld (cs-a)': [meeting('Monday.xlsx', '11:20-12:50')],
+                     'pf (cs-a)': [meeting('Monday.xlsx', '11:00-12:00')]}
+
+    clashes = find_clashes(['OOP (CS-A)', 'DLD (CS-A)', 'PF (CS-A)'], subject_index)
+
+    assert sorted(sorted(item['subjects']) for item in clashes) == [['DLD (CS-A)', 'PF (CS-A)'], ['OOP (CS-A)', 'PF (CS-A)']]
+
+def test_cancelled_meetings_do_not_clash():
+    subject_index = {'oop (cs-a)': [meeting('Monday.xlsx', '10:00-11:20', cancelled=True)],
+                     'dld (cs-a)': [meeting('Monday.xlsx', '10:00-11:20')]}
+
+    assert find_clashes(['OOP (CS-A)', 'DLD (CS-A)'], subject_index) == []
+
+def test_section_plans_route_caps_the_search(client):
+    courses = [['NASCON', 'FSM'], ['AP (23-A)']]
+    response = client.post('/section-plans', json={'courses': courses})
+    assert response.status_code == 200
+    
+    config = client.application.config
+    assert client.post('/section-plans', json={'courses': courses * config['SECTION_PLAN_MAX_COURSES']}).status_code == 413
+    sections = [f'OOP (CS-{i})' for i in range(config['SECTION_PLAN_MAX_SECTIONS'] + 1)]
+    assert client.post('/section-plans', json={'courses': [sections]}).status_code == 413
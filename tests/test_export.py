@@ -0,0 +1,88 @@
+import re
+import csv
+import io
+import datetime
+from export import fold_line, ics_calendar, note_date
+from utils import timetable_columns, timetable_record
+
+start = datetime.date(2024, 1, 22)
+
+def events(records):
+    calendar = ''.join(ics_calendar(records, start, 16, 'Asia/Karachi', week=start))
+    return [event.split('\r\n') for event in calendar.split('BEGIN:VEVENT\r\n')[1:]]
+
+def test_weekly_events_repeat():
+    [event] = events([timetable_record('Tuesday.xlsx', '11:30-12:50', 'C-401', 'Fund of SPM (CS-A)')])
+    
+    assert 'DTSTART;TZID=Asia/Karachi:20240123T113000' in event
+    assert 'RRULE:FREQ=WEEKLY;COUNT=16' in event
+
+def test_one_off_sessions_happen_once():
+    dated, this_week = events([
+        timetable_record('Friday.xlsx', '10:00-11:20', 'C-301', 'Fund of SPM (CS-A)', '26th Jan Only'),
+        timetable_record('Friday.xlsx', '08:30-11:15', 'B-Digital', 'DLD Lab (SE-B)', 'ReSch'),
+    ])
+    
+    assert 'DTSTART;TZID=Asia/Karachi:20240126T100000' in dated
+    assert 'DESCRIPTION:26th Jan Only' in dated
+    assert 'DTSTART;TZID=Asia/Karachi:20240126T083000' in this_week
+    assert not [line for line in dated + this_week if line.startswith('RRULE')]
+
+def test_cancelled_sessions_skip_this_week():
+    [event] = events([
+        timetable_record('Tuesday.xlsx', '02:30-03:50', 'C-307', 'AP (23-A)', None, True),
+        timetable_record('Friday.xlsx', '10:00-11:20', 'C-301', 'PF (CS-A)', '26th Jan Only', True),
+    ])
+    
+    assert 'RRULE:FREQ=WEEKLY;COUNT=16' in event
+    assert 'EXDATE;TZID=Asia/Karachi:20240123T143000' in event
+
+def test_note_date():
+    assert note_date('ReSch (02 Feb)', datetime.date(2024, 1, 26)) == datetime.date(2024, 2, 2)
+    # the year closest to the week the timetable is for
+    assert note_date('28th Dec Only', datetime.date(2024, 1, 5)) == datetime.date(2023, 12, 28)
+    assert note_date('ReSch', datetime.date(2024, 1, 26)) is None
+    assert note_date('31st Feb', datetime.date(2024, 1, 26)) is None
+
+def test_lines_are_folded_at_75_octets():
+    line = 'SUMMARY:' + 'é' * 60
+    folded = fold_line(line)
+    
+    assert all(len(part.encode('utf-8')) <= 75 for part in folded.split('\r\n'))
+    assert folded.replace('\r\n ', '').rstrip('\r\n') == line
+
+def meetings(client, subject):
+    return len(client.post('/time-table', json={'subjects': [subject]}).get_json())
+
+def test_ics_export(client):
+    response = client.post('/time-table/export', json={'subjects': ['NASCON'], 'start': '2024-01-22', 'weeks': 4})
+    calendar = response.get_data(as_text=True)
+    
+    assert response.status_code == 200 and response.mimetype == 'text/calendar'
+    assert calendar.count('BEGIN:VEVENT') == meetings(client, 'NASCON')
+    assert 'DTSTART;TZID=Asia/Karachi:20240122T143000' in calendar
+    assert 'RRULE:FREQ=WEEKLY;COUNT=4' in calendar
+    # stamped with the time it was made, in UTC
+    assert re.search(r'^DTSTAMP:\d{8}T\d{6}Z\r$', calendar, re.MULTILINE)
+
+def test_csv_export(client):
+    response = client.post('/time-table/export', json={'subjects': ['NASCON', 'AP (23-A)'], 'format': 'csv'})
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    
+    assert rows[0] == timetable_columns
+    assert ['Tuesday.xlsx', '02:30-03:50', 'C-307', 'AP (23-A)', '02:30', '03:50', '', 'True'] in rows
+    assert len(rows) == 1 + meetings(client, 'NASCON') + meetings(client, 'AP (23-A)')
+
+def test_cohort_export_skips_invalid_students(client):
+    students = [{'id': 's1', 'subjects': ['NASCON']}, {'id': 's2', 'subjects': [1]}, 'nobody', {'subjects': ['AP (23-A)']}]
+    response = client.post('/time-table/export', json={'students': students, 'format': 'csv'})
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    
+    assert rows[0] == ['Id'] + timetable_columns
+    assert [row[0] for row in rows[1:]] == ['s1'] * meetings(client, 'NASCON') + ['3'] * meetings(client, 'AP (23-A)')
+
+def test_export_rejects_invalid_requests(client):
+    for body in ({'subjects': ['NASCON'], 'weeks': 0}, {'subjects': ['NASCON'], 'weeks': 'many'},
+                 {'subjects': ['NASCON'], 'start': 'monday'}, {'subjects': 'NASCON'}, {'subjects': [1]},
+                 {'subjects': ['NASCON'], 'format': 'pdf'}, {'students': [], 'format': 'ics'}, []):
+        assert client.post('/time-table/export', json=body).status_code == 400
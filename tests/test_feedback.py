@@ -0,0 +1,30 @@
+import io
+import csv
+import sys
+
+def test_csv_export_is_one_snapshot(client, monkeypatch):
+    store = sys.modules['app'].feedback_store
+    assert client.post('/post-feedback', json={'message': 'more labs'}).status_code == 200
+    
+    export = store.export
+    calls = []
+    
+    def export_with_new_feedback():
+        # feedback with a new key arrives between the column scan and the rows
+        calls.append(1)
+        if len(calls) == 2:
+            store.add({'rating': 5})
+        return export()
+    
+    monkeypatch.setattr(store, 'export', export_with_new_feedback)
+    response = client.get('/feedback-export', query_string={'format': 'csv'})
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    
+    assert response.status_code == 200
+    assert [row['message'] for row in rows][-1] == 'more labs'
+    assert all('rating' not in row for row in rows)
+    
+    # the next export has it
+    monkeypatch.setattr(store, 'export', export)
+    rows = list(csv.DictReader(io.StringIO(client.get('/feedback-export', query_string={'format': 'csv'}).get_data(as_text=True))))
+    assert rows[-1]['rating'] == '5'
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+import pytest
+from cells import CellTable
+import history
+from history import cell_columns, changes_cache, changes_since, diff_cells, read_cells, record_version, write_cells
+
+base = [
+    ('Room', 'Monday.xlsx', '08:30-09:50', 'C-301', 'OOP (CS-A)'),
+    ('Room', 'Monday.xlsx', '10:00-11:20', 'C-301', 'DLD (CS-A)'),
+    ('Room', 'Monday.xlsx', '11:30-12:50', 'C-302', 'PF (CS-A)\nAli Khan'),
+    ('Room', 'Tuesday.xlsx', '08:30-09:50', 'C-303', 'Calculus (CS-A) Cancelled'),
+    ('Room', 'Tuesday.xlsx', '10:00-11:20', 'C-304', 'Physics (CS-A)'),
+    ('Lab', 'Tuesday.xlsx', '08:30-11:15', 'Lab-1', 'PF Lab (CS-A)'),
+]
+
+def diff(old, new):
+    return diff_cells(cell_columns(CellTable(old)), cell_columns(CellTable(new)))
+
+def test_identical_versions_have_no_changes():
+    assert diff(base, list(reversed(base))) == []
+
+def test_change_types():
+    new = list(base)
+    new[0] = ('Room', 'Monday.xlsx', '08:30-09:50', 'C-301', 'OOP (CS-A) Cancelled')
+    new[1] = ('Room', 'Monday.xlsx', '10:00-11:20', 'C-305', 'DLD (CS-A)')
+    new[2] = ('Room', 'Monday.xlsx', '11:30-12:50', 'C-302', 'PF (CS-A)\nSara Ahmed')
+    new[3] = ('Room', 'Tuesday.xlsx', '08:30-09:50', 'C-303', 'Calculus (CS-A)')
+    new[4] = ('Room', 'Wednesday.xlsx', '01:00-02:20', 'C-306', 'Physics (CS-A)')
+    del new[5]
+    new.append(('Room', 'Friday.xlsx', '08:30-09:50', 'C-301', 'Stats (CS-A)'))
+
+    changes = {change['subject']: change for change in diff(base, new)}
+
+    assert {subject: change['type'] for subject, change in changes.items()} == {
+        'OOP (CS-A)': 'cancelled',
+        'DLD (CS-A)': 'room_changed',
+        'PF (CS-A)': 'instructor_changed',
+        'Calculus (CS-A)': 'reinstated',
+        'Physics (CS-A)': 'moved',
+        'PF Lab (CS-A)': 'removed',
+        'Stats (CS-A)': 'added',
+    }
+
+    assert changes['DLD (CS-A)']['from']['room'] == 'C-301'
+    assert changes['DLD (CS-A)']['to']['room'] == 'C-305'
+    assert changes['Physics (CS-A)']['to'] == {'kind': 'Room', 'day': 'Wednesday.xlsx', 'time': '01:00-02:20',
+                                             'room': 'C-306', 'instructor': None, 'cancelled': False}
+    assert changes['PF Lab (CS-A)']['to'] is None
+    assert changes['Stats (CS-A)']['from'] is None
+
+def test_repeated_meetings_are_matched_one_to_one():
+    old = [('Room', 'Monday.xlsx', '08:30-09:50', 'C-301', 'OOP (CS-A)')] * 2
+    new = old + [('Room', 'Monday.xlsx', '08:30-09:50', 'C-301', 'OOP (CS-A)')]
+
+    assert [change['type'] for change in diff(old, new)] == ['added']
+    assert [change['type'] for change in diff(new, old)] == ['removed']
+
+@pytest.mark.parametrize('arrow', [True, False])
+def test_snapshots_round_trip(tmp_path, monkeypatch, arrow):
+    if not arrow:
+        monkeypatch.setattr(history, 'pa', None)
+
+    cells = cell_columns(CellTable(base))
+    path = str(tmp_path / ('cells.arrow' if arrow else 'cells.json'))
+    write_cells(path, cells, {'version': 'v1'})
+
+    stored = read_cells(path)
+    assert stored.strings == cells.strings
+    assert diff_cells(stored, cells) == []
+
+def test_recorded_versions_cache_the_diff_from_the_previous_one(tmp_path):
+    old = SimpleNamespace(version='v1', cells=CellTable(base))
+    new = SimpleNamespace(version='v2', cells=CellTable(base[1:]))
+    
+    record_version(old, str(tmp_path))
+    _, changes = record_version(new, str(tmp_path))
+    
+    assert [change['type'] for change in changes] == ['removed']
+    assert changes_cache.get(('v1', 'v2')) is changes
+    assert changes_since('v1', new.cells, 'v2', str(tmp_path)) is changes
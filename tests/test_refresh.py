@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+import utils
+from utils import timetable_sources, timetable_version
+
+def touch(day):
+    # what another worker process does when its refresh downloads a day
+    path = os.path.join(utils.timetable, f'{day}.xlsx')
+    mtime = time.time_ns() + 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+
+def test_workers_pick_up_files_another_worker_downloaded(client, monkeypatch):
+    app = sys.modules['app']
+    monkeypatch.setitem(app.app.config, 'SOURCE_CHECK_INTERVAL', 0.01)
+    loaded = app.timetable_model.version
+    
+    touch('Monday')
+    version = timetable_version(timetable_sources())
+    assert version != loaded
+    
+    deadline = time.monotonic() + 10
+    while app.timetable_model.version != version and time.monotonic() < deadline:
+        time.sleep(0.02)
+        assert client.get('/all-subjects').status_code == 200
+        
+    assert app.timetable_model.version == version
+
+def test_changes_since_a_newer_version_catches_up(client, monkeypatch):
+    app = sys.modules['app']
+    # no background check, /changes alone has to notice
+    monkeypatch.setitem(app.app.config, 'SOURCE_CHECK_INTERVAL', 0)
+    
+    touch('Tuesday')
+    version = timetable_version(timetable_sources())
+    
+    response = client.get('/changes', query_string={'since': version})
+    assert response.status_code == 200
+    assert response.get_json() == {'since': version, 'version': version, 'changes': []}
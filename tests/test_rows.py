@@ -0,0 +1,39 @@
+import os
+import pytest
+import utils
+from utils import clean_rows, day_files, parse_rows, read_day, write_day
+from conftest import shipped_files
+
+def sheet_values(rows):
+    # Sheets sends every cell as text, '' when empty, and cuts rows after their last filled cell
+    values = [['' if value is None else str(value) for value in row] for row in rows]
+    return [row[:max((i + 1 for i, value in enumerate(row) if value), default=0)] for row in values]
+
+def test_clean_rows():
+    assert clean_rows([['Room', '08:30-09:50', ''], ['C-301', 7], [None], ['', '']]) == \
+        [['Room', '08:30-09:50', None], ['C-301', '7', None]]
+    assert clean_rows([]) == []
+
+@pytest.mark.parametrize('arrow', [True, False])
+def test_sheet_values_give_the_rows_of_the_xlsx(tmp_path, monkeypatch, arrow):
+    if not arrow:
+        monkeypatch.setattr(utils, 'pa', None)
+    
+    file = next(file for file in shipped_files if file.endswith('Friday.xlsx'))
+    expected = parse_rows(file)
+    
+    path = write_day(sheet_values(utils.xlsx_rows(file)), str(tmp_path), 'Friday')
+    assert os.path.basename(path) == ('Friday.arrow' if arrow else 'Friday.csv')
+    assert read_day(path) == expected
+
+def test_the_newest_file_of_a_day_wins(tmp_path):
+    for name, mtime in (('Monday.arrow', 2), ('Monday.xlsx', 1), ('Tuesday.csv', 1), ('Tuesday.xlsx', 1), ('Notes.txt', 3)):
+        (tmp_path / name).write_text('')
+        os.utime(tmp_path / name, (mtime, mtime))
+    
+    # same mtime, the order of day_extensions decides
+    assert [(day, os.path.basename(path)) for day, path in day_files(str(tmp_path))] == \
+        [('Monday', 'Monday.arrow'), ('Tuesday', 'Tuesday.xlsx')]
+    
+    os.utime(tmp_path / 'Monday.xlsx', (5, 5))
+    assert dict(day_files(str(tmp_path)))['Monday'].endswith('Monday.xlsx')
@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+import pytest
+import pandas as pd
+from utils import build_occupancy, build_slot_table, find_free_room, find_slot, next_free_slot, parse_timeslot
+
+def minutes(hour, minute):
+    return hour * 60 + minute
+
+def test_parse_timeslot_reads_afternoon_and_evening_times():
+    assert parse_timeslot('08:30-09:50') == (minutes(8, 30), minutes(9, 50))
+    assert parse_timeslot('01:00-02:20') == (minutes(13, 0), minutes(14, 20))
+    assert parse_timeslot('06:45-08:05') == (minutes(18, 45), minutes(20, 5))
+    assert parse_timeslot('05:20 - 08:05 (inc. 10 min. break)') == (minutes(17, 20), minutes(20, 5))
+    assert parse_timeslot('Room') is None
+
+def test_find_slot_boundaries():
+    slots = build_slot_table(['10:00-11:20', '08:30-09:50', 'Break', '11:20-12:50'])
+
+    assert find_slot(slots, minutes(8, 29)) is None
+    assert find_slot(slots, minutes(8, 30)) == 1
+    # the end of a slot still belongs to it
+    assert find_slot(slots, minutes(9, 50)) == 1
+    # between two slots
+    assert find_slot(slots, minutes(9, 55)) is None
+    assert find_slot(slots, minutes(10, 0)) == 0
+    # shared by two slots, the earlier one wins
+    assert find_slot(slots, minutes(11, 20)) == 0
+    assert find_slot(slots, minutes(11, 21)) == 3
+    assert find_slot(slots, minutes(12, 50)) == 3
+    assert find_slot(slots, minutes(12, 51)) is None
+
+def test_find_slot_without_slots():
+    assert find_slot(build_slot_table([]), minutes(10, 0)) is None
+
+def grid():
+    # the unnamed column belongs to the 11:30 timeslot, like a merged header in the sheets
+    return pd.DataFrame([
+        ['C-301', 'OOP (CS-A)', None, None, None, None, None],
+        ['C-302', None, None, None, 'Ideol & Const of Pak (CS-A) 02:00-03:45', None, None],
+        ['C-303', None, 'DLD (CS-A) Cancelled', None, 'Calculus (CS-B)', None, None],
+        ['C-304', None, 'Pak Studies (CS-C) 10:00-01:15', None, None, None, None],
+    ], columns=['Room', '08:30-09:50', '10:00-11:20', '11:30-12:50', None, '02:30-03:50', '03:55-05:15'])
+
+def free(occupancy):
+    return {name: [timeslot for timeslot, busy in zip(occupancy.timeslots, row) if not busy]
+            for name, row in zip(occupancy.names, occupancy.busy)}
+
+def test_occupancy_uses_the_times_classes_run():
+    occupancy = build_occupancy(grid(), 'Room')
+
+    assert occupancy.timeslots == ['08:30-09:50', '10:00-11:20', '11:30-12:50', '02:30-03:50', '03:55-05:15']
+    rooms = free(occupancy)
+    assert rooms['C-301'] == ['10:00-11:20', '11:30-12:50', '02:30-03:50', '03:55-05:15']
+    # a time written in the cell wins over the column it is in
+    assert rooms['C-302'] == ['08:30-09:50', '10:00-11:20', '11:30-12:50', '03:55-05:15']
+    # cancelled sessions are free, a sub-column cell without a time takes the timeslot on its left
+    assert rooms['C-303'] == ['08:30-09:50', '10:00-11:20', '02:30-03:50', '03:55-05:15']
+    # a class longer than its column takes every timeslot it overlaps
+    assert rooms['C-304'] == ['08:30-09:50', '02:30-03:50', '03:55-05:15']
+
+def test_lab_sub_columns_book_the_lab_timeslot():
+    # the 08:30-11:15 lab header is merged over three columns, like Friday's sheet
+    labs = pd.DataFrame([
+        ['Lab-1', None, None, 'DB Lab (SE-D)', None, None],
+        ['Lab-2', None, 'SDA Lab (SE-G)', None, None, 'PF Lab (SE-A)'],
+        ['Lab-3', None, None, None, None, None],
+    ], columns=['Lab', '08:30-11:15', None, None, '11:25-02:10', None])
+    grid = SimpleNamespace(lab_occupancy=build_occupancy(labs, 'Lab'))
+    
+    assert grid.lab_occupancy.timeslots == ['08:30-11:15', '11:25-02:10']
+    assert find_free_room('08:30-11:15', 'Lab', grid) == ['Lab-3']
+    assert find_free_room('11:25-02:10', 'Lab', grid) == ['Lab-1', 'Lab-3']
+
+def test_free_labs_of_the_shipped_timetable(client):
+    response = client.post('/get-free-room', json={'file': 'Friday', 'selection_type': 'Lab', 'timeslot': '08:30-11:15'})
+    assert response.status_code == 200
+    assert not {'C-Margala 1', 'C-Margala 3'} & set(response.get_json())
+    
+    schedule = client.get('/room-schedule', query_string={'room': 'C-Margala 1'}).get_json()
+    assert {'Day': 'Friday.xlsx', 'Time': '08:30-11:15', 'Subject': 'SDA Lab (SE-G)'}.items() <= \
+        next(item for item in schedule if item['Subject'] == 'SDA Lab (SE-G)').items()
+
+def test_next_free_slot():
+    occupancy = build_occupancy(grid(), 'Room')
+    grids = [('Monday', SimpleNamespace(room_occupancy=occupancy))]
+
+    assert next_free_slot('C-302', 'Room', grids, minutes(10, 0)) == ('Monday', '10:00-11:20')
+    assert next_free_slot('C-302', 'Room', grids, minutes(12, 51)) == ('Monday', '03:55-05:15')
+    assert next_free_slot('C-302', 'Room', grids, minutes(17, 16)) is None
+
+def test_next_free_slot_of_an_unknown_room():
+    grids = [('Monday', SimpleNamespace(room_occupancy=build_occupancy(grid(), 'Room')))]
+
+    with pytest.raises(KeyError):
+        next_free_slot('Z-999', 'Room', grids)
+
+def test_next_free_slot_route(client):
+    request = {'room': 'C-301', 'current-day': 'Saturday', 'current-time': '10:00AM'}
+    
+    # from a day without a timetable the search starts on monday morning
+    response = client.post('/next-free-slot', json=request)
+    assert response.status_code == 200
+    assert response.get_json() == client.post('/next-free-slot', json={**request, 'current-day': 'Monday',
+                                                                       'current-time': '08:00AM'}).get_json()
+    
+    assert client.post('/next-free-slot', json={**request, 'current-day': 'Funday'}).status_code == 400
+    assert client.post('/next-free-slot', json={**request, 'current-time': None}).status_code == 400
+    assert client.post('/next-free-slot', json={**request, 'current-day': 'Monday', 'current-time': 'noon'}).status_code == 400
+    assert client.post('/next-free-slot', json={**request, 'room': 'Z-999'}).status_code == 404
+
+def test_free_room_routes_answer_invalid_requests_with_4xx(client):
+    routes = ['/selected-file', '/get-free-room', '/day-free-rooms', '/now-empty', '/next-free-slot', '/submit-rating']
+    for route in routes:
+        for body in ([], 'Monday', None):
+            assert client.post(route, json=body).status_code == 400, (route, body)
+    
+    assert client.post('/day-free-rooms', json={'file': 'Saturday'}).status_code == 404
+    assert client.post('/day-free-rooms', json={'file': '../config'}).status_code == 400
+    assert client.post('/get-free-room', json={'file': 'Monday', 'selection_type': 'Room',
+                                               'timeslot': '07:00-08:00'}).status_code == 400
+    assert client.post('/now-empty', json={'current-day': 'Monday', 'current-time': '25:00PM'}).status_code == 400
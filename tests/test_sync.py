@@ -0,0 +1,47 @@
+import os
+import csv
+from sync import LocalSheetsClient, sync_timetable
+
+def write_sheet(path, rows, mtime):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows(rows)
+    os.utime(path, (mtime, mtime))
+
+def day_rows(subject):
+    return [['Timetable'], ['Room', '08:30-09:50'], ['C-301', subject]]
+
+def test_sync_skips_unchanged_and_rewrites_only_edited_days(tmp_path):
+    sheets = tmp_path / 'sheets'
+    folder = tmp_path / 'timetable'
+    state = tmp_path / 'state' / 'sync_state.json'
+    sheets.mkdir()
+
+    for day in ('Monday', 'Tuesday'):
+        write_sheet(sheets / f'{day}.csv', day_rows(f'OOP ({day})'), 1_000_000)
+    # sheets that aren't days never make it into the timetable
+    write_sheet(sheets / 'Notes.csv', [['notes']], 1_000_000)
+
+    client = LocalSheetsClient(str(sheets))
+    assert sync_timetable(client, 'local', str(folder), str(state)) == ['Monday', 'Tuesday']
+    assert sorted(os.listdir(folder)) == ['Monday.arrow', 'Tuesday.arrow']
+
+    # nothing edited, nothing fetched or written
+    monday_mtime = os.stat(folder / 'Monday.arrow').st_mtime_ns
+    assert sync_timetable(client, 'local', str(folder), str(state)) == []
+
+    write_sheet(sheets / 'Tuesday.csv', day_rows('DLD (Tuesday)'), 2_000_000)
+    assert sync_timetable(client, 'local', str(folder), str(state)) == ['Tuesday']
+    assert os.stat(folder / 'Monday.arrow').st_mtime_ns == monday_mtime
+
+def test_sync_restores_a_deleted_day(tmp_path):
+    sheets = tmp_path / 'sheets'
+    folder = tmp_path / 'timetable'
+    state = tmp_path / 'sync_state.json'
+    sheets.mkdir()
+    write_sheet(sheets / 'Monday.csv', day_rows('OOP (CS-A)'), 1_000_000)
+
+    client = LocalSheetsClient(str(sheets))
+    sync_timetable(client, 'local', str(folder), str(state))
+    os.remove(folder / 'Monday.arrow')
+
+    assert sync_timetable(client, 'local', str(folder), str(state)) == ['Monday']
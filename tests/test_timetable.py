@@ -0,0 +1,52 @@
+import os
+import json
+from cells import CellTable, subject_key
+from utils import build_subject_index, parse_timeslot, timetable_columns, timetable_json, timetable_records
+
+# /all-subjects and /time-table of every subject as the original pandas implementation answered them on
+# the shipped timetable, records are [Day, Time, Class]
+with open(os.path.join(os.path.dirname(__file__), 'data', 'baseline.json'), encoding='utf-8') as file:
+    baseline = json.load(file)
+
+def test_catalog_covers_the_baseline(client):
+    subjects = {subject.casefold() for subject in client.get('/all-subjects').get_json()}
+    # the baseline listed a lab timeslot header as a subject
+    expected = {subject_key(subject) for subject in baseline['subjects'] if parse_timeslot(subject) is None}
+    
+    assert expected <= subjects
+
+def test_time_table_finds_every_baseline_record(client):
+    missing = {}
+    for subject, expected in baseline['timetable'].items():
+        records = client.post('/time-table', json={'subjects': [subject]}).get_json()
+        found = {(record['Day'], record['Time'], record['Class']) for record in records}
+        
+        assert all(record['Subject'] == subject for record in records)
+        missing.update({subject: record for record in map(tuple, expected) if record not in found})
+        
+    assert missing == {}
+
+def test_time_table_records(client):
+    records = client.post('/time-table', json={'subjects': ['NASCON', 'FSM']}).get_json()
+    
+    assert all(list(record) == timetable_columns for record in records)
+    # in the order the subjects were asked for
+    subjects = [record['Subject'] for record in records]
+    assert subjects == sorted(subjects, key=['NASCON', 'FSM'].index) and set(subjects) == {'NASCON', 'FSM'}
+    assert records[0] == {'Day': 'Monday.xlsx', 'Time': '02:30-03:50', 'Class': 'A-118 (MEDC)', 'Subject': 'NASCON',
+                          'Start_Time': '02:30', 'End_Time': '03:50', 'Note': None, 'Cancelled': False}
+
+def test_timetable_json_matches_the_records():
+    subject_index = build_subject_index(CellTable([
+        ('Room', 'Monday.xlsx', '08:30-09:50', 'C-301', 'OOP (CS-A)'),
+        ('Room', 'Tuesday.xlsx', '10:00-11:20', 'C-302', 'DLD (CS-A) Cancelled'),
+        ('Lab', 'Friday.xlsx', '08:30-11:15', 'Lab-1', 'OOP Lab (CS-A) 26th Jan Only'),
+    ]))
+    
+    for subjects in (['OOP (CS-A)', 'dld (cs-a)'], ['DLD (CS-A)', 'Missing (CS-Z)', 'OOP Lab (CS-A)', 'DLD (CS-A)'], []):
+        expected = timetable_records(subjects, subject_index)
+        
+        assert json.loads(timetable_json(subjects, subject_index)) == expected
+        # the second call joins cached fragments
+        timetable_json(subjects, subject_index, version='v1')
+        assert json.loads(timetable_json(subjects, subject_index, version='v1')) == expected
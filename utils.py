@@ -1,5 +1,39 @@
 import os
+import re
+import csv
+import json
+import hashlib
+import logging
+import bisect
+import threading
+import multiprocessing
+from datetime import datetime
+from contextlib import contextmanager
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 import pandas as pd
+import openpyxl
+
+try:
+    # optional, used for the compiled snapshot of the timetable files
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:
+    pa = None
+
+try:
+    # optional, a faster JSON encoder for the timetable responses
+    import orjson
+except ImportError:
+    orjson = None
+
+from metrics import metrics, stage_timer
+from search import SubjectSearch
+from cells import CellTable, Meeting, parse_cell, subject_key
+
+log = logging.getLogger(__name__)
 
 # defining variables and base paths
 spreadsheet_url = 'https://docs.google.com/spreadsheets/d/1feZLJJN4NDjAnqA8J5vHnVGrl9R91-NFGOqAW0gU5h4/edit?usp=sharing'
@@ -8,354 +42,916 @@ output_folder = os.path.join(base_path, 'timetable')
 # spreadsheet_title = 'TimeTable, FSC, Spring-2024'
 credentials_path = os.path.join(base_path, 'timetable-api-412213-75a336ca8f77.json')
 timetable = os.path.join(base_path, 'timetable')
-# Get a list of all files in the folder
-all_files = os.listdir(timetable)
+# days that make up the timetable, other sheets are ignored
+timetable_days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+# compiled copies of the timetable files, see read_day()
+snapshot_folder = os.path.join(base_path, 'timetable_snapshot')
+
+# formats a day of the timetable can be stored in, the newest file of a day wins and this order breaks ties
+# .arrow is the compact copy written by sync, .xlsx / .csv are exports of the spreadsheet
+day_extensions = ('.arrow', '.xlsx', '.csv')
+# files already reported as hidden by a newer file of the same day
+shadowed_files = set()
+
+def order_files(file):
+    order = {
+        "Monday.xlsx": 0,
+        "Tuesday.xlsx": 1,
+        "Wednesday.xlsx": 2,
+        "Thursday.xlsx": 3,
+        "Friday.xlsx": 4,
+        "Saturday.xlsx": 5,
+        "Sunday.xlsx": 6
+    }
+    # any format of a day sorts like its xlsx file
+    name = os.path.splitext(os.path.basename(file))[0]
+    return order.get(f'{name}.xlsx', 0)
 
-def drop_top_rows(df):    
+def day_files(folder=None):
     '''
-        this function will be called in a loop and unnecessary rows of all days dataframes will be dropped
+        (day, path) of every day stored in the timetable folder, in week order
+        a day stored in several formats is listed once by its newest file, see day_extensions
+        so an xlsx copied in by hand replaces an older synced copy of the day
     '''
-    df.drop([0, 1, 2], axis=0, inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    df.columns = df.iloc[0] # make time schedule the column name/header
+    folder = folder or timetable
+    candidates = {}
+    
+    for file in os.listdir(folder):
+        name, extension = os.path.splitext(file)
+        if extension not in day_extensions:
+            continue
+        path = os.path.join(folder, file)
+        candidates.setdefault(name, []).append((-os.stat(path).st_mtime_ns, day_extensions.index(extension), path))
+    
+    files = {}
+    for name, found in candidates.items():
+        found.sort()
+        files[name] = found[0][2]
+        
+        for mtime, _, path in found[1:]:
+            if (path, mtime) not in shadowed_files:
+                shadowed_files.add((path, mtime))
+                log.info('%s is ignored, %s is newer', path, found[0][2])
+            
+    return [(name, files[name]) for name in sorted(files, key=order_files)]
 
-    schedule = list(df.columns)
-    cleaned_schedule = [value for value in schedule if not pd.isna(value)]
+def day_label(day):
+    '''
+        name of a day in the Day field of the responses, clients know the days by their xlsx file name
+    '''
+    return f'{day}.xlsx'
 
-    df = df[cleaned_schedule]
-    df.drop(0, axis=0, inplace=True)
+def xlsx_rows(file):
+    '''
+        rows of the first worksheet of an xlsx file as tuples of cell values
+    '''
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+def csv_rows(file):
+    with open(file, newline='', encoding='utf-8') as csv_file:
+        yield from csv.reader(csv_file)
+
+def clean_rows(rows):
+    '''
+        turns raw rows from any source into lists of the same width
+        with every cell as text and None for empty cells
+        Sheets sends '' for empty cells, openpyxl None and numbers as numbers
+    '''
+    rows = [[None if value is None or value == '' else str(value) for value in row] for row in rows]
+    
+    # trailing empty rows carry nothing
+    while rows and not any(value is not None for value in rows[-1]):
+        rows.pop()
+    
+    width = max((len(row) for row in rows), default=0)
+    return [row + [None] * (width - len(row)) for row in rows]
 
-    df.reset_index(drop=True, inplace=True)
-    # df.head()
+@contextmanager
+def atomic_path(path):
+    '''
+        temporary path to write a file at, moved over path once the block is done
+        other workers never read a half written file, a failed write leaves path as it was
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
     
-    return df
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def write_rows(path, rows, metadata):
+    '''
+        stores cleaned rows as an uncompressed arrow file, one text column per sheet column
+    '''
+    width = len(rows[0]) if rows else 0
+    columns = {f'c{i}': pa.array([row[i] for row in rows], type=pa.string()) for i in range(width)}
+    write_table(path, columns, {**metadata, 'format': 'rows'})
 
-def separate_labs_and_classes(df, classes, labs):    
+def write_table(path, columns, metadata):
     '''
-        finds the splitting point of labs and classes
-        stores lab df to labs list and class df to class list
+        stores {name: array} as an uncompressed arrow file with metadata
     '''
-    lab_df = df[df.eq('Lab').any(axis=1)]
-    ind = list(lab_df.index)[0]
+    table = pa.table(columns).replace_schema_metadata(metadata)
+    
+    with atomic_path(path) as tmp_path:
+        feather.write_feather(table, tmp_path, compression='uncompressed')
 
-    classes.append(df[:ind])
+def read_table(path):
+    '''
+        {name: numpy array} and metadata of a file stored by write_table, numeric columns are memory mapped
+    '''
+    table = feather.read_table(path, memory_map=True)
+    columns = {name: column.to_numpy() for name, column in zip(table.column_names, table.columns)}
+    return columns, table.schema.metadata or {}
 
-    lab_df = df[ind:]
-    lab_df.reset_index(drop=True, inplace=True)
-    lab_df.columns = lab_df.iloc[0]
+def arrow_rows(path):
+    '''
+        rows stored by write_rows along with the metadata they were stored with
+    '''
+    table = feather.read_table(path, memory_map=True)
+    columns = [column.to_pylist() for column in table.columns]
+    return [list(row) for row in zip(*columns)], table.schema.metadata or {}
+    
+def snapshot_path(file):
+    '''
+        path of the compiled snapshot belonging to a timetable file
+    '''
+    name = os.path.splitext(os.path.basename(file))[0]
+    return os.path.join(snapshot_folder, f'{name}.arrow')
 
-    schedule = list(lab_df.columns)
-    cleaned_schedule = [value for value in schedule if not pd.isna(value)]
+def write_snapshot(file, rows):
+    '''
+        stores the cleaned rows of a timetable file as its snapshot
+        together with the mtime of the source, so it can be memory mapped later
+    '''
+    write_rows(snapshot_path(file), rows, {'source_mtime': str(os.stat(file).st_mtime_ns)})
 
-    lab_df = lab_df[cleaned_schedule]
-    lab_df.drop(0, axis=0, inplace=True)
+def read_snapshot(file):
+    '''
+        returns the cleaned rows of a timetable file from its snapshot
+        None when there is no snapshot or the source file changed since it was written
+    '''
+    path = snapshot_path(file)
+    if not os.path.exists(path):
+        return None
+    
+    rows, metadata = arrow_rows(path)
+    # snapshots of older versions held a DataFrame instead of rows
+    if metadata.get(b'format') != b'rows' or metadata.get(b'source_mtime') != str(os.stat(file).st_mtime_ns).encode():
+        return None
+    
+    return rows
 
-    lab_df.reset_index(drop=True, inplace=True)
-    labs.append(lab_df)
-    # lab_df.head()
+def parse_rows(file):
+    '''
+        reads the cleaned rows of an xlsx or csv file
+    '''
+    if file.endswith('.csv'):
+        with stage_timer('csv_parse'):
+            return clean_rows(csv_rows(file))
+        
+    with stage_timer('excel_parse'):
+        return clean_rows(xlsx_rows(file))
+
+def read_compiled(file):
+    '''
+        the cleaned rows of a timetable file when they can be read without parsing it, otherwise None
+        arrow files are read as they are, xlsx and csv files through their compiled snapshot when it is up to date
+    '''
+    with stage_timer('snapshot_load'):
+        if file.endswith('.arrow'):
+            return arrow_rows(file)[0]
+        if pa is None:
+            return None
+        return read_snapshot(file)
+
+def compile_day(file):
+    '''
+        parses an xlsx or csv file and compiles its snapshot, returns the cleaned rows
+    '''
+    rows = parse_rows(file)
+    if pa is not None:
+        write_snapshot(file, rows)
+    return rows
+
+def read_day(file):
+    '''
+        reads the cleaned rows of a timetable file, parsing and compiling it when there is no up to date snapshot
+    '''
+    rows = read_compiled(file)
+    return rows if rows is not None else compile_day(file)
+
+def pool_context():
+    '''
+        forked workers start at once and don't import the app again, without fork files are parsed serially
+    '''
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+def read_days(files, workers=0, pool_min_bytes=1 << 20):
+    '''
+        cleaned rows of every file, in the order of files
+        files that have to be parsed are spread over a pool of workers processes when there are several
+        and together they are at least pool_min_bytes, starting a worker costs more than parsing a small file
+        workers 0 is one per CPU, 1 parses in this process
+    '''
+    rows = [read_compiled(file) for file in files]
+    missing = [files[position] for position, day_rows in enumerate(rows) if day_rows is None]
     
-def order_files(file):
-    order = {
-        "Monday.xlsx": 0,
-        "Tuesday.xlsx": 1,
-        "Wednesday.xlsx": 2,
-        "Thursday.xlsx": 3,
-        "Friday.xlsx": 4,
-        "Saturday.xlsx": 5,
-        "Sunday.xlsx": 6
-    }
-    return order.get(file, 0)
+    workers = min(workers or os.cpu_count() or 1, len(missing))
+    context = pool_context()
+    parsed = None
+    
+    if workers > 1 and context is not None and sum(os.path.getsize(file) for file in missing) >= pool_min_bytes:
+        log.info('Parsing %d timetable files with %d processes', len(missing), workers)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                parsed = list(pool.map(parse_rows, missing))
+        except (OSError, BrokenProcessPool):
+            log.warning('Could not parse in worker processes, parsing serially', exc_info=True)
+            
+    if parsed is None:
+        parsed = [parse_rows(file) for file in missing]
+        
+    # snapshots are written here, the workers only parse
+    parsed = iter(parsed)
+    for position, file in enumerate(files):
+        if rows[position] is None:
+            rows[position] = next(parsed)
+            if pa is not None:
+                write_snapshot(file, rows[position])
+        
+    return rows
+
+def write_day(values, folder, day):
+    '''
+        stores the raw values of a day worksheet in folder in the compact format, csv without pyarrow
+        other formats of the same day are left alone, being older they no longer count, see day_files
+    '''
+    rows = clean_rows(values)
+    
+    if pa is not None:
+        path = os.path.join(folder, f'{day}.arrow')
+        write_rows(path, rows, {})
+    else:
+        path = os.path.join(folder, f'{day}.csv')
+        with atomic_path(path) as tmp_path, open(tmp_path, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows([['' if value is None else value for value in row] for row in rows])
+            
+    return path
+
+def compile_snapshot():
+    '''
+        compiles snapshots of all xlsx / csv timetable files and removes the ones whose source is gone
+    '''
+    if pa is None:
+        raise RuntimeError('pyarrow is required to compile the timetable snapshot')
+    
+    sources = [path for _, path in day_files() if not path.endswith('.arrow')]
+    for file in sources:
+        write_snapshot(file, parse_rows(file))
+        
+    compiled = {os.path.basename(snapshot_path(file)) for file in sources}
+    for file in os.listdir(snapshot_folder):
+        if file.endswith('.arrow') and file not in compiled:
+            os.remove(os.path.join(snapshot_folder, file))
+            
+    return sorted(compiled)
+
+def split_sheet(rows):
+    '''
+        splits the cleaned rows of a day into (class header, class rows, lab header, lab rows)
+        the sheet starts with a title row and three rows of program names, then the 'Room' header
+        with the class timeslots, the class rows, and from the first row holding 'Lab' the lab header and lab rows
+    '''
+    header, body = rows[4], rows[5:]
+    
+    split = next((i for i, row in enumerate(body) if 'Lab' in row), None)
+    if split is None:
+        raise ValueError('The timetable has no Lab header row')
+    
+    return header, body[:split], body[split], body[split + 1:]
+
+def day_frames(rows):
+    '''
+        builds the class and lab grids of a day from its cleaned rows
+        both keep the unnamed columns of merged timeslot headers, their cells belong to the timeslot on their left
+    '''
+    class_header, class_rows, lab_header, lab_rows = split_sheet(rows)
+    
+    classes_df = pd.DataFrame(class_rows, columns=class_header)
+    lab_df = pd.DataFrame(lab_rows, columns=lab_header)
+    
+    return classes_df, lab_df
     
-def preprocess():
+def preprocess(workers=0, pool_min_bytes=1 << 20):
     '''
         prepare the classes and labs list
         store dfs of all days in these 2 lists
+        workers and pool_min_bytes decide when files are parsed in parallel, see read_days
     '''
     classes=[] # list to store dataframe of all classes of all days of the week
     labs=[] # list to store dataframe of all labs of all days of the week
+    days = []
     
-    # Get a list of all files in the folder
-    all_files = os.listdir(timetable)
+    # every day file in week order, whatever format it is stored in
+    files = day_files()
+    
+    for (day, _), rows in zip(files, read_days([file for _, file in files], workers, pool_min_bytes)):
+        classes_df, lab_df = day_frames(rows)
+        
+        classes.append(classes_df)
+        labs.append(lab_df)
+        days.append(day_label(day))
+        
+    # every cell is taken apart once, the index and catalog are built from the parts
+    cells = CellTable(iter_cells(classes, labs, days))
+    subject_index = build_subject_index(cells)
+    subjects = build_subject_catalog(cells)
+        
+    return classes, labs, cells, subject_index, subjects
 
-    # Filter for files with .xlsx extension
-    xlsx_files = [file for file in all_files if file.endswith(".xlsx")]
-    # order the files
-    xlsx_files = sorted(xlsx_files, key=order_files)
+# everything the read routes serve from memory, built in one go by build_timetable()
+# and replaced as a whole, never modified in place
+Timetable = namedtuple('Timetable', ['cells', 'subject_index', 'subjects', 'subjects_etag', 'sources',
+                                     'subject_search', 'version', 'room_schedules', 'instructor_schedules'])
 
-    # Loop through each Excel file and read its contents
-    for excel_file in xlsx_files:
-        # Construct the full path to the Excel file within the subfolder
-        excel_file_path = os.path.join(timetable, excel_file)
-        df = pd.read_excel(excel_file_path)
+def timetable_sources():
+    '''
+        (file, mtime) of every timetable file, tells whether a loaded model is still current
+    '''
+    return tuple((os.path.basename(path), os.stat(path).st_mtime_ns) for _, path in sorted(day_files()))
+
+def build_timetable(workers=0, pool_min_bytes=1 << 20):
+    '''
+        parses the timetable files into a new Timetable
+    '''
+    # taken before parsing, a file changing halfway shows up as stale on the next refresh
+    sources = timetable_sources()
+    with stage_timer('preprocess'):
+        # the grids are only needed to build the cell table, each worker keeps just the cells
+        _, _, cells, subject_index, subjects = preprocess(workers, pool_min_bytes)
         
-        drop_top_rows(df)
-        separate_labs_and_classes(df, classes, labs)
+        # weekly views the schedule routes serve as they are
+        room_schedules = build_schedules(cells, 'room')
+        instructor_schedules = build_schedules(cells, 'instructor')
+    
+    return Timetable(cells, subject_index, subjects, catalog_version(subjects), sources,
+                     SubjectSearch(subjects), timetable_version(sources), room_schedules, instructor_schedules)
+
+def timetable_version(sources):
+    '''
+        short id of a loaded timetable, changes whenever one of its files does
+    '''
+    return hashlib.sha1(repr(sources).encode('utf-8')).hexdigest()[:16]
+
+def normalize_subject(value):
+    '''
+        lookup key of a cell or a requested subject, its course and section without times, notes or extra whitespace
+        so that both end up as the same lookup key
+    '''
+    return subject_key(value)
+
+def iter_cells(classes, labs, days):
+    '''
+        walks over every filled cell of the class and lab grids of all days
+        yields (kind, day, slot, room, cell) where kind is 'Room' for classes and 'Lab' for labs
+    '''
+    for kind, frames in (('Room', classes), ('Lab', labs)):
+        for day, df in zip(days, frames):
+            # merged header cells leave nan column names, those cells belong to the slot on their left
+            slots = pd.Series(df.columns).ffill().tolist()
+            
+            for row in df.itertuples(index=False):
+                # first column holds the room / lab name
+                room = row[0]
+                if pd.isna(room) or room == kind:
+                    continue
+                
+                for slot, cell in zip(slots[1:], row[1:]):
+                    if not pd.isna(cell):
+                        yield kind, day, slot, room, cell
+
+def build_subject_index(cells):
+    '''
+        builds an inverted index from normalized subject to all of its occurrences from the cell table
+        every occurrence is a Meeting, cancelled sessions stay in with their flag so timetables still show them
+        the meetings hold the interned strings of the cell table, they add references not copies
+        requests name subjects by string, so the index is keyed by the string and lookups stay one dict get
+    '''
+    subject_index = {}
+    string = cells.string
+    
+    for row in range(len(cells)):
+        key = string(cells.key[row])
+        if not key:
+            continue
         
-    return classes, labs
+        # some cells carry their own timing e.g. 'Ideol & Const of Pak (CS-B) 11:30-01:15', it is in the time column
+        subject_index.setdefault(key, []).append(
+            Meeting(string(cells.day[row]), string(cells.time[row]), string(cells.room[row]), string(cells.kind[row]),
+                    string(cells.note[row]), bool(cells.cancelled[row])))
+                    
+    return subject_index
+
+def build_subject_catalog(cells):
+    '''
+        sorted list of all subjects avaialable in the timetable as course (section)
+        a subject spelled differently across cells or with notes like 'Cancelled' is listed once
+    '''
+    subjects = {}
+    
+    for subject_id, key_id in zip(cells.subject, cells.key):
+        subject = cells.string(subject_id)
+        if subject:
+            subjects.setdefault(cells.string(key_id), subject)
+            
+    return sorted(subjects.values())
+
+def catalog_version(subjects):
+    '''
+        short content hash of the subject catalog, used as its ETag
+    '''
+    return hashlib.sha1('\n'.join(subjects).encode('utf-8')).hexdigest()[:16]
         
-def generate_timetable(subjects, classes, labs):
+def generate_timetable(subjects, subject_index):
     '''
         this function takes a list of subjects and
-        generates a timetable for it
-    '''
-
-    # print('------------------in utils.py--------------------')
-    # print('------------------labs list----------------------')    
-    # print(classes)
-    # print(labs)
-    # print('------------------in utils.py--------------------')
-    # print('------------------labs list----------------------')
-    
-    result_day = []
-    result_time = []
-    result_class = []
-    result_subject = []
-    # Filter for files with .xlsx extension
-    xlsx_files = [file for file in all_files if file.endswith(".xlsx")]
-    xlsx_files = sorted(xlsx_files, key=order_files)
-    
-    for desired_value in subjects:
-        # Loop through each Excel file and read its contents
-        file_number = -1
-        for df in classes:   
-            file_number += 1             
-            # Check if the value is present in any cell across all columns
-            result_rows = df[df.isin([desired_value]).any(axis=1)]
-            room = result_rows['Room'].tolist()
-            
-            if len(result_rows) != 0:
-                row_index = result_rows.index.tolist()[0]
-            
-                # Get the row at the specified index
-                row_values = df.iloc[row_index]
+        generates a timetable for it using the prebuilt subject index
+    '''
+    return pd.DataFrame(timetable_records(subjects, subject_index), columns=timetable_columns)
 
-                # Find columns containing the specific value in the row
-                matching_columns = [col for col, value in row_values.items() if value == desired_value]
-                
-            # store result if found
-            if room != []:
-                if len(matching_columns) > 1:
-                    for time in matching_columns:
-                        result_day.append(xlsx_files[file_number])
-                        result_time.append(time)
-                        result_class.append(room)
-                        result_subject.append(desired_value)                        
-                else:
-                    # print('match found')
-                    result_day.append(xlsx_files[file_number])
-                    result_time.append(matching_columns)
-                    result_class.append(room)
-                    result_subject.append(desired_value)
-                
-        # if result not found in a class dataframe then search for it in the lab dataframe
-        file_number = -1
-        for df in labs:   
-            file_number += 1   
-            # Check if the value is present in any cell across all columns
-            result_rows = df[df.isin([desired_value]).any(axis=1)]
-            room = result_rows['Lab'].tolist()
-
-            if len(result_rows) != 0:
-                row_index = result_rows.index.tolist()[0]
-            
-                # Get the row at the specified index
-                row_values = df.iloc[row_index]
+# fields of a timetable record, in the order /time-table returns them
+timetable_columns = ['Day', 'Time', 'Class', 'Subject', 'Start_Time', 'End_Time', 'Note', 'Cancelled']
 
-                # Find columns containing the specific value in the row
-                matching_columns = [col for col, value in row_values.items() if value == desired_value]
+def timetable_records(subjects, subject_index):
+    '''
+        the rows of a generated timetable as plain records, in the order of the subjects
+    '''
+    records = []
+    
+    with stage_timer('index_lookup'):
+        for desired_value in subjects:
+            for meeting in subject_index.get(normalize_subject(desired_value), []):
+                records.append(meeting_record(meeting, desired_value))
                 
-            # store result if found
-            if room != []:
-                if len(matching_columns) > 1:
-                    for time in matching_columns:
-                        result_day.append(xlsx_files[file_number])
-                        result_time.append(time)
-                        result_class.append(room)
-                        result_subject.append(desired_value)                        
-                else:
-                    # print('match found')
-                    result_day.append(xlsx_files[file_number])
-                    result_time.append(matching_columns)
-                    result_class.append(room)
-                    result_subject.append(desired_value)
-
-    # Create a DataFrame
-    data = {'Day': result_day, 'Time': result_time, 'Class': result_class, 'Subject': result_subject}
-    
-    # print('------------------in utils.py--------------------')
-    # print('------------------labs list----------------------')
-    # print(result_day)
-    # print(result_class)
-    # print(result_time)
-    # print('------------------in utils.py--------------------')
-    # print('------------------labs list----------------------')
-    
-    result = pd.DataFrame(data)
-    
-    # print(result)
-
-    def format(value):
-        if isinstance(value, list):
-            return value[0]
-        else:
-            return value
+    return records
     
-    def start_time(time):
-        return time.split('-')[0]
+def timetable_record(day, time, room, subject, note=None, cancelled=False):
+    '''
+        one row of a generated timetable with the fields /time-table returns
+        note is what the cell says after the section e.g. '26th Jan Only'
+    '''
+    start, _, end = time.partition('-')
+    return {'Day': day, 'Time': time, 'Class': room, 'Subject': subject, 'Start_Time': start, 'End_Time': end,
+            'Note': note, 'Cancelled': cancelled}
 
-    def end_time(time):
-        return time.split('-')[1]
+def meeting_record(meeting, subject):
+    '''
+        timetable row of a Meeting of the subject index
+    '''
+    return timetable_record(meeting.day, meeting.time, meeting.room, subject, meeting.note, meeting.cancelled)
 
-    result['Time'] = result['Time'].apply(format)
-    result['Class'] = result['Class'].apply(format)
+def json_bytes(value):
+    '''
+        compact JSON encoding, with orjson when it is installed
+    '''
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+def timetable_json(subjects, subject_index, version=None):
+    '''
+        the generated timetable of the subjects encoded as a JSON list of records, without a DataFrame in between
+        the encoded records of every subject are cached by the sorted subject tuple and the timetable version,
+        the body is then joined in the order the subjects were asked for
+    '''
+    cache_key = (version, tuple(sorted(set(subjects))))
+    fragments = timetable_cache.get(cache_key) if version is not None else None
     
-    # print(result)
+    if fragments is None:
+        fragments = {}
+        for subject in cache_key[1]:
+            records = timetable_records([subject], subject_index)
+            # the records without the surrounding brackets
+            fragments[subject] = json_bytes(records)[1:-1]
+            
+        if version is not None:
+            timetable_cache.put(cache_key, fragments)
+            
+    return b'[' + b','.join(fragments[subject] for subject in subjects if fragments[subject]) + b']'
 
-    # Extract start and end times from the 'Time' column
-    result['Start_Time'] = result['Time'].apply(start_time)
-    result['End_Time'] = result['Time'].apply(end_time)
+def build_schedules(cells, column):
+    '''
+        weekly schedule of every room or instructor, column is 'room' or 'instructor' of the cell table
+        {name: records} with the /time-table fields plus Kind and Instructor, by day and start time
+        cancelled sessions stay in so the room shows as booked but free
+    '''
+    string = cells.string
+    schedules = {}
     
-    return result
+    for name, rows in cells.groups(column).items():
+        records = []
+        for row in rows:
+            day, time = string(cells.day[row]), string(cells.time[row])
+            record = timetable_record(day, time, string(cells.room[row]), string(cells.subject[row]),
+                                      string(cells.note[row]), bool(cells.cancelled[row]))
+            record.update(Kind=string(cells.kind[row]), Instructor=string(cells.instructor[row]))
+            
+            interval = parse_timeslot(time)
+            records.append(((order_files(day), interval[0] if interval else 24 * 60, record['Class']), record))
+            
+        records.sort(key=lambda item: item[0])
+        schedules[name] = [record for _, record in records]
+        
+    return schedules
+
+def schedule_json(schedules, name, view, version):
+    '''
+        encoded schedule of one room / instructor, cached per timetable version
+        None when name has no schedule
+    '''
+    if name not in schedules:
+        return None
     
-def remove_xlsx_files():
-    # List all files in the current directory
-    all_files = os.listdir(output_folder)
+    cache_key = (version, view, name)
+    body = schedule_cache.get(cache_key)
+    if body is None:
+        body = json_bytes(schedules[name])
+        schedule_cache.put(cache_key, body)
+        
+    return body
 
-    # Filter files with .xlsx extension
-    xlsx_files = [file for file in all_files if file.endswith(".xlsx")]
-    allowed_files = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-    allowed_files = [os.path.join(output_folder, f"{filename}.xlsx") for filename in allowed_files]    
+def batch_timetables(students, subject_index):
+    '''
+        generates timetables of many students one at a time, yields (id, records) or (id, error)
+        every unique subject is looked up once for the whole batch
+        students are dicts with subjects and an optional id, the position in the batch is the default id
+    '''
+    resolved = {}
     
-    # Remove each .xlsx file
-    for xlsx_file in xlsx_files:
-        file_path = os.path.join(output_folder, xlsx_file)
+    for position, student in enumerate(students):
+        student_id = student.get('id', position) if isinstance(student, dict) else position
+        subjects = student.get('subjects') if isinstance(student, dict) else None
         
-        if file_path not in allowed_files:
-            os.remove(file_path)
-            print(f"Removed file: {file_path}")
+        if not isinstance(subjects, list) or not all(isinstance(subject, str) for subject in subjects):
+            yield student_id, None, 'subjects must be a list of strings'
+            continue
+        
+        records = []
+        for desired_value in subjects:
+            key = normalize_subject(desired_value)
+            if key not in resolved:
+                resolved[key] = subject_index.get(key, [])
+                
+            records.extend(meeting_record(meeting, desired_value) for meeting in resolved[key])
             
-def get_timeslots(file, stype='Room'):
-    df = pd.read_excel(file)
-    df = drop_top_rows(df)
+        yield student_id, records, None
     
-    lab_df = df[df.eq('Lab').any(axis=1)]
-    ind = list(lab_df.index)[0]
-
-    classes_df = df[:ind]
-    lab_df = df[ind:]
-
-    if stype=='Room':    
-        timeslots = classes_df.columns.tolist()
-        
+def remove_extra_files():
+    '''
+        removes files of sheets that are not days of the timetable
+    '''
+    for file in os.listdir(output_folder):
+        name, extension = os.path.splitext(file)
         
-    else:
-        lab_df.reset_index(drop=True, inplace=True)
-        lab_df.columns = lab_df.iloc[0]
+        if extension in day_extensions and name not in timetable_days:
+            file_path = os.path.join(output_folder, file)
+            os.remove(file_path)
+            log.info("Removed file: %s", file_path)
+            
+# parsed grid of one day, timeslot lists exclude the 'Room' / 'Lab' column
+DayGrid = namedtuple('DayGrid', ['classes_df', 'lab_df', 'room_timeslots', 'lab_timeslots',
+                                 'room_occupancy', 'lab_occupancy'])
+
+# rooms (or labs) x timeslots boolean matrix, True where the room is taken
+# slots holds the timeslots as time intervals, see build_slot_table()
+Occupancy = namedtuple('Occupancy', ['names', 'timeslots', 'busy', 'slots'])
 
-        schedule = list(lab_df.columns)
-        cleaned_schedule = [value for value in schedule if not pd.isna(value)]
+# timeslot intervals in minutes of the day sorted by start, columns points back into the timeslot list
+SlotTable = namedtuple('SlotTable', ['starts', 'ends', 'columns'])
 
-        lab_df = lab_df[cleaned_schedule]
-        lab_df.drop(0, axis=0, inplace=True)
+# start and end of a timeslot header like '08:30-09:50' or '05:20 - 08:05 (inc. 10 min. break)'
+timeslot_pattern = re.compile(r'(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})')
 
-        lab_df.reset_index(drop=True, inplace=True)
+def clock_minutes(hour, minute):
+    '''
+        minutes since midnight of a time written without AM/PM on the timetable
+        classes run from 8 in the morning, so 8 to 11 are AM and 12 to 7 are PM
+    '''
+    if hour < 8:
+        hour += 12
+    return hour * 60 + minute
 
-        timeslots = lab_df.columns.tolist()
+def parse_timeslot(timeslot):
+    '''
+        (start, end) in minutes of the day of a timeslot header, None when it holds no time range
+    '''
+    match = timeslot_pattern.search(str(timeslot))
+    if match is None:
+        return None
+    
+    start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+    start = clock_minutes(start_hour, start_minute)
+    end = clock_minutes(end_hour, end_minute)
+    
+    # a slot like '06:45-08:05' ends in the evening, not the next morning
+    if end <= start:
+        end += 12 * 60
         
-    timeslots.remove(stype)
-    return timeslots, classes_df, lab_df
+    return start, end
+
+def build_slot_table(timeslots):
+    intervals = sorted(
+        (interval[0], interval[1], column)
+        for column, interval in ((column, parse_timeslot(timeslot)) for column, timeslot in enumerate(timeslots))
+        if interval is not None
+    )
+    
+    starts = [start for start, _, _ in intervals]
+    ends = [end for _, end, _ in intervals]
+    columns = [column for _, _, column in intervals]
+    
+    return SlotTable(starts, ends, columns)
 
-def find_free_room(selected_timeslot, stype, classes_df, lab_df):
-    result = None
-    if stype == 'Room':
-        # filter null values and cancelled classes
-        filtered_df = classes_df[(classes_df[selected_timeslot].isnull()) | (classes_df[selected_timeslot].str.contains('cancel'))]
-        result = filtered_df['Room'].tolist()
+def find_slot(slot_table, minute):
+    '''
+        column of the timeslot containing minute, None when no timeslot does
+        on a boundary shared by two slots the earlier one wins
+    '''
+    position = bisect.bisect_right(slot_table.starts, minute) - 1
+    
+    if position > 0 and minute <= slot_table.ends[position - 1]:
+        position -= 1
+    if position < 0 or minute > slot_table.ends[position]:
+        return None
+    
+    return slot_table.columns[position]
 
-    else:
-        # filter null values and cancelled labs
-        filtered_df = lab_df[(lab_df[selected_timeslot].isnull()) | (lab_df[selected_timeslot].str.contains('cancel'))]
-        result = filtered_df['Lab'].tolist()
+def build_occupancy(df, stype):
+    '''
+        marks every room / lab as busy or free in every named timeslot of a grid
+        a class takes every timeslot its time overlaps, the time written in the cell when it has one
+        e.g. 'Ideol & Const of Pak (CS-A) 02:00-03:45', otherwise the timeslot of its column
+        unnamed columns of merged headers belong to the timeslot on their left
+        empty cells and cancelled sessions count as free
+    '''
+    # rows without a room name can never be offered as free
+    df = df[df[stype].notna()]
+    headers = list(df.columns)
+    
+    named = [column for column, value in enumerate(headers) if value is not None and value != stype]
+    timeslots = [headers[column] for column in named]
+    
+    # timeslot of every column, -1 for the room column and anything left of the first timeslot
+    owners = np.full(len(headers), -1)
+    for position, column in enumerate(named):
+        owners[column:] = position
+    
+    intervals = [parse_timeslot(timeslot) or (-1, -1) for timeslot in timeslots]
+    starts = np.array([start for start, _ in intervals])
+    ends = np.array([end for _, end in intervals])
+    
+    values = df.to_numpy(dtype=object)
+    busy = np.zeros((len(values), len(timeslots)), dtype=bool)
+    
+    for row, column in zip(*np.nonzero(pd.notna(values))):
+        owner = owners[column]
+        if owner < 0:
+            continue
         
-    return result
-
-from datetime import datetime
+        # every distinct cell is parsed once, see cells.parse_cell
+        cell = parse_cell(values[row, column])
+        if cell.cancelled:
+            continue
+        
+        interval = parse_timeslot(cell.time) if cell.time else intervals[owner]
+        if interval is None or interval[0] < 0:
+            busy[row, owner] = True
+        else:
+            busy[row] |= (starts < interval[1]) & (ends > interval[0])
+    
+    names = np.array(df[stype].tolist(), dtype=object)
+    
+    return Occupancy(names, timeslots, busy, build_slot_table(timeslots))
 
-def update_time_ranges(time_ranges):
-    updated_time_ranges = []
+def parse_day_grid(file):
+    '''
+        splits a day file into its class and lab grids along with their timeslots
+        free rooms are looked up under the named timeslots, the cells of merged sub-columns count towards them
+    '''
+    classes_df, lab_df = day_frames(read_day(file))
+    
+    room_occupancy = build_occupancy(classes_df, 'Room')
+    lab_occupancy = build_occupancy(lab_df, 'Lab')
+    
+    return DayGrid(classes_df, lab_df, room_occupancy.timeslots, lab_occupancy.timeslots,
+                   room_occupancy, lab_occupancy)
 
-    for time_range in time_ranges:
-        # '05:20 - 08:05 (inc. 10 min. break)  '
-        if '(' in time_range:
-            time_range = time_range.split('(')[0].strip()
+class GridCache:
+    '''
+        bounded LRU cache of parsed day grids keyed by (file path, mtime)
+        a file that changed on disk gets a new key so a stale grid is never served
+        cached grids are shared between requests and must not be modified
+    '''
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._grids = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def get(self, file):
+        path = os.path.abspath(file)
+        key = (path, os.stat(path).st_mtime_ns)
+        
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is not None:
+                self._grids.move_to_end(key)
+                self.hits += 1
+                return grid
+            self.misses += 1
             
-        time_range = time_range.strip()
-        start, end = time_range.split('-')
-        start = start.strip()
-        end = end.strip()
-        start_hour = int(start.split(':')[0])
-        # start_minute = int(start.split(':')[1])
-        end_hour = int(end.split(':')[0])
-        # end_minute = int(start.split(':')[1])
+        # parse outside the lock, two requests racing on a cold file both parse it once
+        grid = parse_day_grid(path)
         
-        if start_hour >= 8 and start_hour < 12:
-            updated_start = f'{start}AM'
-        else:
-            updated_start = f'{start}PM'
+        with self._lock:
+            # forget older versions of the same file
+            for old_key in [k for k in self._grids if k[0] == path]:
+                del self._grids[old_key]
+                
+            self._grids[key] = grid
+            while len(self._grids) > self.maxsize:
+                self._grids.popitem(last=False)
+                
+        return grid
+    
+    def invalidate(self, file):
+        path = os.path.abspath(file)
+        with self._lock:
+            for key in [k for k in self._grids if k[0] == path]:
+                del self._grids[key]
+    
+    def clear(self):
+        with self._lock:
+            self._grids.clear()
+            
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._grids), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
 
-        if end_hour >= 8 and end_hour < 12:
-            updated_end = f'{end}AM'
-        else:
-            updated_end = f'{end}PM'
+class LRUCache:
+    '''
+        small thread-safe LRU cache for computed responses, keys must be hashable
+    '''
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return default
+        
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._items), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+grid_cache = GridCache()
+# encoded /time-table records, see timetable_json
+timetable_cache = LRUCache(maxsize=1024)
+# encoded room / instructor schedules, see schedule_json
+schedule_cache = LRUCache(maxsize=1024)
+
+def cache_samples():
+    stats = grid_cache.stats()
+    return [
+        ('timetable_grid_cache_hits_total', {}, stats['hits']),
+        ('timetable_grid_cache_misses_total', {}, stats['misses']),
+        ('timetable_grid_cache_size', {}, stats['size']),
+        ('timetable_response_cache_hits_total', {}, timetable_cache.hits),
+        ('timetable_response_cache_misses_total', {}, timetable_cache.misses),
+    ]
+
+metrics.add_collector(cache_samples)
+            
+def get_timeslots(file, stype='Room'):
+    '''
+        returns the timeslots of the selected type along with the parsed grid of a day file
+    '''
+    with stage_timer('get_timeslots'):
+        grid = grid_cache.get(file)
+    
+    if stype == 'Room':
+        timeslots = list(grid.room_timeslots)
+    else:
+        timeslots = list(grid.lab_timeslots)
+        
+    return timeslots, grid
 
-        updated_time_ranges.append(f'{updated_start}-{updated_end}')
+def get_occupancy(grid, stype):
+    return grid.room_occupancy if stype == 'Room' else grid.lab_occupancy
 
-    # print(updated_time_ranges)
-    return updated_time_ranges
+def free_rooms(occupancy, start, span=1):
+    '''
+        rooms free in span consecutive timeslots beginning at timeslot index start
+        a span running past the last timeslot covers the rest of the day
+    '''
+    busy = occupancy.busy[:, start:start + span].any(axis=1)
+    return occupancy.names[~busy].tolist()
 
+def find_free_room(selected_timeslot, stype, grid, span=1):
+    '''
+        rooms / labs free in the selected timeslot, or in it and the span - 1 slots after it
+    '''
+    occupancy = get_occupancy(grid, stype)
+    
+    if selected_timeslot not in occupancy.timeslots:
+        raise ValueError(f'No timeslot {selected_timeslot} on this day')
+    start = occupancy.timeslots.index(selected_timeslot)
+    
+    return free_rooms(occupancy, start, span)
 
-# Function to convert time string to datetime object
-def time_str_to_datetime(time_str):
-    return datetime.strptime(time_str, '%I:%M%p')
+def free_rooms_by_timeslot(stype, grid, span=1):
+    '''
+        free rooms / labs for every timeslot of a day in timeslot order
+    '''
+    occupancy = get_occupancy(grid, stype)
+    
+    return [{'timeslot': timeslot, 'rooms': free_rooms(occupancy, start, span)}
+            for start, timeslot in enumerate(occupancy.timeslots)]
 
-# Function to compare times considering only hours and minutes
-def compare_times(time1, time2):
-    return time1.replace(second=0, microsecond=0) == time2.replace(second=0, microsecond=0)
+def time_str_to_minutes(time_str):
+    '''
+        minutes since midnight of a time like '10:30AM' or '10:30 am'
+    '''
+    time = datetime.strptime(time_str.replace(' ', '').upper(), '%I:%M%p')
+    return time.hour * 60 + time.minute
 
-def format_time(time):
-    res = ''
-    for t in time:
-        if t.isnumeric() or t==':' or t=='-':
-            res += t
-            
-    return res
+def match_timeslot(given_time, occupancy):
+    '''
+        timeslot of the grid that contains the given time e.g. '10:30AM', None when it falls in no timeslot
+    '''
+    column = find_slot(occupancy.slots, time_str_to_minutes(given_time))
+    
+    if column is None:
+        return None
+    
+    return occupancy.timeslots[column]
 
-def match_timeslot(given_time, time_intervals, stype):
-    time_intervals = update_time_ranges(time_intervals)
-        
-    print(time_intervals)
-    given_time = time_str_to_datetime(given_time)
-    # Iterate through time intervals and check if the given time falls within any interval
-    interval_found = False
-    for interval in time_intervals:
-        start_str, end_str = interval.split('-')
-        start_time = time_str_to_datetime(start_str)
-        end_time = time_str_to_datetime(end_str)
-        
-        # print(start_time, given_time, end_time)
+def next_free_slot(room, stype, grids, minute=0):
+    '''
+        first timeslot in which a room / lab is free
+        grids are (day, grid) pairs searched in order, on the first day timeslots ending before minute are skipped
+        returns (day, timeslot) or None, raises KeyError when no grid has the room
+    '''
+    known = False
+    
+    for position, (day, grid) in enumerate(grids):
+        occupancy = get_occupancy(grid, stype)
         
-        if start_time <= given_time <= end_time:
-            interval_found = True
-            print(f"The given time {given_time.strftime('%Y-%m-%d %I:%M:%S %p')} falls within the interval: {interval}")
-            break
-        elif compare_times(given_time, end_time):
-            interval_found = True
-            print(f"The given time {given_time.strftime('%Y-%m-%d %I:%M:%S %p')} falls within the interval: {interval}")
-            break
-
-    if not interval_found:
-        print("The given time does not fall within any interval.")
-        return None
+        rows = np.flatnonzero(occupancy.names == room)
+        if len(rows) == 0:
+            continue
+        known = True
         
-    return format_time(interval)
-
+        slots = occupancy.slots
+        free = ~occupancy.busy[rows[0], slots.columns]
+        if position == 0:
+            free &= np.array(slots.ends) >= minute
+            
+        if free.any():
+            return day, occupancy.timeslots[slots.columns[int(free.argmax())]]
+    
+    if not known:
+        raise KeyError(room)
+    return None